@@ -79,12 +79,14 @@ class ActionModule(ActionNetworkModule):
         if not sockPath:
             sockPath = self._connection.socket_path
 
-        conn = Connection(sockPath)
-        out = conn.get_prompt()
-        while to_text(out, errors="surrogate_then_replace").strip().endswith(")#"):
-            display.vvvv("wrong context, send exit...", self._play_context.remote_addr)
-            conn.send_command("exit")
+        if persConn != "netconf":
+            # Netconf has no cli prompt (and no configuration context to leave)
+            conn = Connection(sockPath)
             out = conn.get_prompt()
+            while to_text(out, errors="surrogate_then_replace").strip().endswith(")#"):
+                display.vvvv("wrong context, send exit...", self._play_context.remote_addr)
+                conn.send_command("exit")
+                out = conn.get_prompt()
 
         result = super(ActionModule, self).run(task_vars=task_vars)
         return result
@@ -1,38 +1,54 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+import hashlib
 import json
 # Copyright: Contributors to the Ansible project
 # GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
-import re
+import time
+from collections import OrderedDict
 
-from ansible.module_utils._text import to_text
+from ansible.module_utils._text import to_bytes, to_text
 from ansible.plugins.cliconf import CliconfBase, enable_mode
 from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.utils import \
     to_list
+from ansible_collections.sense.junos.plugins.module_utils.network.junos import (
+    normalize_command, parse_device_info)
 from ansible_collections.sense.junos.plugins.module_utils.runwrapper import \
     classwrapper
+from ansible_collections.sense.junos.plugins.module_utils.statestore import \
+    StateStore
+
+# Max number of command results kept in the per host result cache
+RESULT_CACHE_SIZE = 128
+# Seconds device info (model, version, hostname) is cached on disk
+DEVICE_INFO_TTL = 86400
 
 
 @classwrapper
 class Cliconf(CliconfBase):
+    def __init__(self, *args, **kwargs):
+        super(Cliconf, self).__init__(*args, **kwargs)
+        # Lives in the persistent connection process, so it is shared by
+        # all tasks of the play for this host. key: (timestamp, output)
+        self._result_cache = OrderedDict()
+        self._cache_stats = {"hits": 0, "misses": 0}
+        self._device_info = None
+        self._capabilities = None
+        # Commit started by start_commit: {"id", "command", "output"}
+        self._commit = None
+
     def get_device_info(self):
-        """Get Device Info"""
-        devInfo = {}
-
-        devInfo["network_os"] = "sense.junos.junos"
-        reply = self.get("show platform")
-        data = to_text(reply, errors="surrogate_or_strict").strip()
-
-        match = re.search(r"freeRouter (\S+),", data)
-        if match:
-            devInfo["network_os_version"] = match.group(1)
-        match = re.search(r"hwid: (\S+)", data, re.M)
-        if match:
-            devInfo["network_os_hwid"] = match.group(1)
-        match = re.search(r"name: (\S+)", data, re.M)
-        if match:
-            devInfo["network_os_hostname"] = match.group(1)
+        """Get Device Info (cached in memory and on disk for DEVICE_INFO_TTL)"""
+        if self._device_info:
+            return self._device_info
+        store = StateStore(self._connection.get_option("host"), "device_info")
+        devInfo = store.get("device_info", DEVICE_INFO_TTL)
+        if not devInfo:
+            reply = self.get("show version | display json")
+            devInfo = parse_device_info(to_text(reply, errors="surrogate_or_strict"))
+            store.set("device_info", devInfo)
+        self._device_info = devInfo
         return devInfo
 
     @enable_mode
@@ -73,7 +89,90 @@ class Cliconf(CliconfBase):
             check_all=check_all,
         )
 
+    def get_to_file(self, command, path):
+        """Run command and write raw output to path. Output is not returned
+        (nor parsed), so it never reaches the module process"""
+        data = to_bytes(self.get(command), errors="surrogate_or_strict")
+        with open(path, "wb") as fobj:
+            fobj.write(data)
+        return {"path": path, "bytes": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+    def get_cached(self, command, ttl, withHit=False):
+        """Get command output from result cache, run it if missing or expired.
+        withHit returns {"output": output, "hit": answered from cache}"""
+        key = normalize_command(command)
+        now = time.time()
+        entry = self._result_cache.get(key)
+        if entry and now - entry[0] <= ttl:
+            self._result_cache.move_to_end(key)
+            self._cache_stats["hits"] += 1
+            return {"output": entry[1], "hit": True} if withHit else entry[1]
+        self._cache_stats["misses"] += 1
+        out = self.get(command)
+        self._result_cache[key] = (now, out)
+        self._result_cache.move_to_end(key)
+        while len(self._result_cache) > RESULT_CACHE_SIZE:
+            self._result_cache.popitem(last=False)
+        return {"output": out, "hit": False} if withHit else out
+
+    def invalidate_cache(self):
+        """Drop all cached command results (e.g. after commit)"""
+        self._result_cache.clear()
+
+    def get_cache_stats(self):
+        """Get result cache hits/misses"""
+        return dict(self._cache_stats, entries=len(self._result_cache))
+
+    # start_commit/poll_commit use network_cli private members (_ssh_shell,
+    # _strip, _find_prompt, _sanitize): public receive() blocks until the
+    # prompt and drops partial output on timeout, so it can not poll. These
+    # members are checked against the ansible.netcommon range in galaxy.yml.
+    def start_commit(self, commitId, command):
+        """Send commit without waiting for it to finish. Output is collected
+        with poll_commit, other commands are refused until it is collected"""
+        if self._commit:
+            raise ValueError(f"commit {self._commit['id']} is still running")
+        self.send_command(command=command, sendonly=True)
+        self._commit = {"id": commitId, "command": command, "output": b""}
+
+    def get_pending_commit(self):
+        """Get id of started and not yet collected commit (None if none)"""
+        return self._commit["id"] if self._commit else None
+
+    def _read_available(self):
+        """Read output available on the shell without blocking"""
+        shell = self._connection._ssh_shell
+        data = b""
+        if hasattr(shell, "recv_ready"):
+            # paramiko channel
+            while shell.recv_ready():
+                data += shell.recv(65535)
+            return data
+        # ansible-pylibssh channel
+        while True:
+            chunk = shell.read_nonblocking(65535)
+            if not chunk:
+                return data
+            data += chunk
+
+    def poll_commit(self, commitId):
+        """Read output of commit started with start_commit (never blocks).
+        Returns {"known": bool, "done": bool, "output": text}. Once the
+        device prints the prompt, commit is done and forgotten"""
+        if not self._commit or self._commit["id"] != commitId:
+            # Not started on this connection (or already collected)
+            return {"known": False, "done": True, "output": ""}
+        self._commit["output"] += self._read_available()
+        output = self._connection._strip(self._commit["output"])
+        if not self._connection._find_prompt(output):
+            return {"known": True, "done": False, "output": to_text(output, errors="replace")}
+        output = self._connection._sanitize(output, self._commit["command"].encode())
+        self._commit = None
+        return {"known": True, "done": True, "output": to_text(output, errors="replace")}
+
     def get_capabilities(self):
         """Get capabilities"""
-        result = super(Cliconf, self).get_capabilities()
-        return json.dumps(result)
+        if not self._capabilities:
+            result = super(Cliconf, self).get_capabilities()
+            self._capabilities = json.dumps(result)
+        return self._capabilities
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Host local admission control for heavy commands and commits per device.
+Copyright: Contributors to the SENSE Project
+GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+Locks are flock()ed files in the state directory, so they are shared by all
+playbooks (processes) on the controller and released if a process dies:
+  heavy.N.lock  - one per allowed concurrent heavy command
+  commit.lock   - one commit at a time
+  priority.lock - held (shared) by pending commits, heavy reads wait for it
+  commit.held   - async commit still running on the device (commit_async);
+                  keeps the commit slot after the module exits, until
+                  commit_status collects it or it expires
+"""
+import fcntl
+import json
+import os
+import re
+import time
+
+from ansible_collections.sense.junos.plugins.module_utils.statestore import (
+    getStateDir, writeAtomic)
+
+HEAVY_COMMANDS = [
+    re.compile(r"^show route\b"),
+    re.compile(r"^show ethernet-switching table"),
+    re.compile(r"^show configuration"),
+    re.compile(r"^show vlans\b.*\b(detail|extensive)\b"),
+    re.compile(r"^show interfaces(?!.*\bterse\b)"),
+    re.compile(r"\bextensive\b"),
+]
+
+# Sleep between lock attempts (seconds)
+POLL_INTERVAL = 0.2
+# Held async commit expiry if admission_timeout is 0 (seconds)
+HELD_COMMIT_TTL = 3600
+
+
+class AdmissionTimeout(Exception):
+    """Admission wait timeout."""
+
+
+def classify(command):
+    """Classify command by cost: commit, heavy or light"""
+    command = command.strip()
+    if command.startswith("commit") or command == "configure private":
+        return "commit"
+    if any(regex.search(command) for regex in HEAVY_COMMANDS):
+        return "heavy"
+    return "light"
+
+
+class Admission:
+    """Admission control for one device"""
+
+    def __init__(self, host, maxHeavy, timeout=600, statedir=None):
+        host = re.sub(r"[^\w.\-]", "_", str(host or "localhost"))
+        self.lockdir = os.path.join(statedir or getStateDir(), host, "locks")
+        os.makedirs(self.lockdir, exist_ok=True)
+        self.maxHeavy = maxHeavy
+        self.timeout = timeout
+        self.fds = []
+
+    def _open(self, name):
+        """Open lock file"""
+        return os.open(os.path.join(self.lockdir, name), os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _tryLock(self, fd, mode):
+        """Try to lock without blocking"""
+        try:
+            fcntl.flock(fd, mode | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def _commitPending(self):
+        """Check if any commit is pending (holds priority lock)"""
+        fd = self._open("priority.lock")
+        try:
+            if self._tryLock(fd, fcntl.LOCK_EX):
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                return False
+            return True
+        finally:
+            os.close(fd)
+
+    def _wait(self, startTime):
+        """Sleep before next attempt, raise AdmissionTimeout if waiting too long"""
+        if self.timeout and time.time() - startTime > self.timeout:
+            self.release()
+            raise AdmissionTimeout(f"waited more than {self.timeout}s for device admission")
+        time.sleep(POLL_INTERVAL)
+
+    def _heldPath(self):
+        """Path of held async commit slot"""
+        return os.path.join(self.lockdir, "commit.held")
+
+    def holdCommit(self, commitId, ttl):
+        """Keep commit slot for async commit (until releaseCommit or ttl)"""
+        writeAtomic(self._heldPath(), json.dumps({"id": commitId, "expires": time.time() + ttl}))
+
+    def getHeldCommit(self):
+        """Get async commit keeping the commit slot (None if none or expired)"""
+        try:
+            with open(self._heldPath(), "r", encoding="utf-8") as fd:
+                held = json.load(fd)
+        except (OSError, ValueError):
+            return None
+        return held if held.get("expires", 0) > time.time() else None
+
+    def releaseCommit(self, commitId):
+        """Release commit slot kept for async commit commitId"""
+        held = self.getHeldCommit()
+        if held and held.get("id") != commitId:
+            return
+        try:
+            os.unlink(self._heldPath())
+        except FileNotFoundError:
+            pass
+
+    def acquire(self, kind):
+        """Acquire admission for command kind. Returns time waited (seconds)"""
+        startTime = time.time()
+        if kind == "commit":
+            # Announce pending commit first, so new heavy reads wait
+            fd = self._open("priority.lock")
+            fcntl.flock(fd, fcntl.LOCK_SH)
+            self.fds.append(fd)
+            fd = self._open("commit.lock")
+            self.fds.append(fd)
+            while not self._tryLock(fd, fcntl.LOCK_EX):
+                self._wait(startTime)
+            while self.getHeldCommit():
+                self._wait(startTime)
+        elif kind == "heavy" and self.maxHeavy:
+            while True:
+                if not self._commitPending():
+                    for slot in range(self.maxHeavy):
+                        fd = self._open(f"heavy.{slot}.lock")
+                        if self._tryLock(fd, fcntl.LOCK_EX):
+                            self.fds.append(fd)
+                            return time.time() - startTime
+                        os.close(fd)
+                self._wait(startTime)
+        return time.time() - startTime
+
+    def release(self):
+        """Release all held locks"""
+        for fd in self.fds:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self.fds = []
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""Content addressed (deduplicated) config backup store.
+Copyright: Contributors to the SENSE Project
+GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+Configs are split into hierarchy blocks (top level statements, large blocks
+are split further into their children) and sibling blocks are grouped into
+chunks of up to CHUNK_MAX_LINES lines. Each unique chunk is stored once
+(shared by all hosts) and every backup is a manifest of block hashes:
+  <root>/objects/ab/abcdef...     - block content
+  <root>/<host>/manifests/<id>.json - backup manifest
+  <root>/<host>/index.json          - latest manifest and commit marker
+Rebuild or diff backups:
+    python3 -m ansible_collections.sense.junos.plugins.module_utils.backupstore list <host>
+    python3 -m ansible_collections.sense.junos.plugins.module_utils.backupstore rebuild <host> <id>
+    python3 -m ansible_collections.sense.junos.plugins.module_utils.backupstore diff <host> <id1> <id2>
+"""
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import re
+import time
+
+from ansible_collections.sense.junos.plugins.module_utils.statestore import (
+    StateStore, getStateDir, writeAtomic)
+
+# Blocks with more lines are split into their child blocks
+CHUNK_MAX_LINES = 100
+# Sibling blocks are grouped until a block with hash % CHUNK_BOUNDARY == 0
+# (content defined, so an inserted block changes only its own chunk)
+CHUNK_BOUNDARY = 8
+
+
+def getIndent(line):
+    """Get line indentation"""
+    return len(line) - len(line.lstrip())
+
+
+def splitBlocks(lines, indent):
+    """Split lines into blocks, each starting with a statement at indent
+    (closing braces stay with the block they close)"""
+    blocks = []
+    for line in lines:
+        if (
+            not blocks
+            or getIndent(line) <= indent
+            and line.strip()
+            and not line.strip().startswith("}")
+        ):
+            blocks.append([line])
+        else:
+            blocks[-1].append(line)
+    return blocks
+
+
+def isBoundary(block):
+    """Check if chunk ends after block (content defined boundary)"""
+    digest = hashlib.sha256("\n".join(block).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % CHUNK_BOUNDARY == 0
+
+
+def chunkLines(lines, indent=0, maxLines=CHUNK_MAX_LINES):
+    """Split lines into chunks (list of line lists), in order"""
+    chunks, group = [], []
+    for block in splitBlocks(lines, indent):
+        if len(block) > maxLines:
+            if group:
+                chunks.append(group)
+                group = []
+            closing = block[-1].strip() == "}"
+            inner = block[1:-1] if closing else block[1:]
+            indents = [getIndent(line) for line in inner if line.strip()]
+            if indents and min(indents) > indent:
+                chunks.append(block[:1])
+                chunks.extend(chunkLines(inner, min(indents), maxLines))
+                if closing:
+                    chunks.append(block[-1:])
+            else:
+                chunks.append(block)
+            continue
+        if group and len(group) + len(block) > maxLines:
+            chunks.append(group)
+            group = []
+        group.extend(block)
+        if isBoundary(block):
+            chunks.append(group)
+            group = []
+    if group:
+        chunks.append(group)
+    return chunks
+
+
+def chunkConfig(config, maxLines=CHUNK_MAX_LINES):
+    """Split config into chunks. "\\n".join(chunks) rebuilds config"""
+    return ["\n".join(chunk) for chunk in chunkLines(config.splitlines(), 0, maxLines)]
+
+
+def getHash(data):
+    """sha256 hex digest of text"""
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class BackupStore:
+    """Deduplicated config backups of a host"""
+
+    def __init__(self, host, rootdir=None):
+        self.rootdir = rootdir or os.path.join(getStateDir(), "backups")
+        self.host = re.sub(r"[^\w.\-]", "_", str(host or "localhost"))
+        self.manifestdir = os.path.join(self.rootdir, self.host, "manifests")
+        self.index = StateStore(self.host, "index", statedir=self.rootdir)
+
+    def _objectPath(self, digest):
+        """Path of stored block"""
+        return os.path.join(self.rootdir, "objects", digest[:2], digest)
+
+    def _manifestPath(self, manifestId):
+        """Path of manifest"""
+        return os.path.join(self.manifestdir, f"{os.path.basename(manifestId)}.json")
+
+    def getLatest(self):
+        """Get latest manifest id and commit marker ({} if no backups)"""
+        self.index.reload()
+        return self.index.get("latest", default={})
+
+    def isCurrent(self, marker):
+        """Check if latest backup was taken at the same commit marker"""
+        latest = self.getLatest()
+        return bool(marker and latest.get("marker") == marker and latest.get("id"))
+
+    def add(self, config, marker=None):
+        """Store config. Returns manifest (with count of newly stored blocks)"""
+        chunks = chunkConfig(config)
+        digests, newChunks, newBytes = [], 0, 0
+        for chunk in chunks:
+            digest = getHash(chunk)
+            digests.append(digest)
+            path = self._objectPath(digest)
+            if not os.path.exists(path):
+                writeAtomic(path, chunk)
+                newChunks += 1
+                newBytes += len(chunk)
+        configHash = getHash(config)
+        latest = self.getLatest()
+        if latest.get("sha256") == configHash:
+            # Same config (commit without changes), only update marker
+            manifest = self.load(latest["id"])
+        else:
+            timestamp = time.time()
+            manifestId = time.strftime("%Y%m%dT%H%M%S", time.gmtime(timestamp))
+            manifest = {
+                "id": f"{manifestId}-{configHash[:12]}",
+                "host": self.host,
+                "timestamp": timestamp,
+                "sha256": configHash,
+                "size": len(config),
+                "chunks": digests,
+                "lines": [chunk.count("\n") + 1 for chunk in chunks],
+            }
+            writeAtomic(self._manifestPath(manifest["id"]), json.dumps(manifest))
+        manifest["marker"] = marker or {}
+        self.index.set(
+            "latest", {"id": manifest["id"], "sha256": configHash, "marker": manifest["marker"]}
+        )
+        return dict(manifest, new_chunks=newChunks, new_bytes=newBytes)
+
+    def list(self):
+        """List manifest ids (oldest first)"""
+        if not os.path.isdir(self.manifestdir):
+            return []
+        names = os.listdir(self.manifestdir)
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    def load(self, manifestId):
+        """Load manifest"""
+        with open(self._manifestPath(manifestId), "r", encoding="utf-8") as fd:
+            return json.load(fd)
+
+    def getChunk(self, digest):
+        """Get stored block"""
+        with open(self._objectPath(digest), "r", encoding="utf-8") as fd:
+            return fd.read()
+
+    def _getLines(self, digests):
+        """Get lines of stored blocks"""
+        return [line for digest in digests for line in self.getChunk(digest).split("\n")]
+
+    def rebuild(self, manifestId):
+        """Rebuild config of backup"""
+        return "\n".join(self.getChunk(digest) for digest in self.load(manifestId)["chunks"])
+
+    def diff(self, oldId, newId):
+        """Diff two backups (unified diff lines, without context). Only blocks
+        with different hashes are read and compared"""
+        oldManifest, newManifest = self.load(oldId), self.load(newId)
+        old, new = oldManifest["chunks"], newManifest["chunks"]
+        if old == new:
+            return []
+        out = [f"--- {oldId}", f"+++ {newId}"]
+        # First line number of each chunk
+        oldLine, newLine = [0], [0]
+        for manifest, lineStart in ((oldManifest, oldLine), (newManifest, newLine)):
+            for count in manifest["lines"]:
+                lineStart.append(lineStart[-1] + count)
+        matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            oldLines = self._getLines(old[i1:i2])
+            newLines = self._getLines(new[j1:j2])
+            lineMatcher = difflib.SequenceMatcher(None, oldLines, newLines, autojunk=False)
+            for ltag, k1, k2, l1, l2 in lineMatcher.get_opcodes():
+                if ltag == "equal":
+                    continue
+                out.append(
+                    f"@@ -{oldLine[i1] + k1 + 1},{k2 - k1} +{newLine[j1] + l1 + 1},{l2 - l1} @@"
+                )
+                out.extend("-" + line for line in oldLines[k1:k2])
+                out.extend("+" + line for line in newLines[l1:l2])
+        return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Junos config backup store")
+    parser.add_argument("--root", default=None)
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("list").add_argument("host")
+    rebuildParser = subparsers.add_parser("rebuild")
+    rebuildParser.add_argument("host")
+    rebuildParser.add_argument("id")
+    diffParser = subparsers.add_parser("diff")
+    diffParser.add_argument("host")
+    diffParser.add_argument("old")
+    diffParser.add_argument("new")
+    args = parser.parse_args()
+    store = BackupStore(args.host, args.root)
+    if args.action == "list":
+        print("\n".join(store.list()))
+    elif args.action == "rebuild":
+        print(store.rebuild(args.id))
+    else:
+        print("\n".join(store.diff(args.old, args.new)))
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""Junos syslog event listener, marks junos_facts subsets dirty.
+Copyright: Contributors to the SENSE Project
+GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+Run listener (devices must send syslog to it, e.g. set system syslog host <ip> any any):
+    python3 -m ansible_collections.sense.junos.plugins.module_utils.events --port 5514
+Host key is the syslog sender address (use --use-hostname for syslog hostname),
+it must match ansible host of the device.
+"""
+import argparse
+import re
+import socketserver
+import time
+
+from ansible_collections.sense.junos.plugins.module_utils.statestore import \
+    StateStore
+
+# Event: (subsets marked dirty, subsets where only the interface is marked dirty)
+EVENT_SUBSETS = {
+    "UI_COMMIT_COMPLETED": (["interfaces", "interfaces_status"], []),
+    "SNMP_TRAP_LINK_DOWN": (["interfaces_status"], ["interfaces"]),
+    "SNMP_TRAP_LINK_UP": (["interfaces_status"], ["interfaces"]),
+    "LLDP_NEIGHBOR_DOWN": ([], ["interfaces"]),
+    "LLDP_NEIGHBOR_UP": ([], ["interfaces"]),
+}
+
+SYSLOG_RE = [
+    # RFC5424 (structured-data): event is MSGID
+    re.compile(
+        r"^(?:<\d+>)?1 \S+ (?P<host>\S+) \S+ \S+ (?P<event>\S+) (?:\[.*?\]|-)\s?(?P<msg>.*)$"
+    ),
+    # BSD syslog: Mmm dd hh:mm:ss host process[pid]: EVENT: message
+    re.compile(
+        r"^(?:<\d+>)?\w{3}\s+\d+ \d+:\d+:\d+ (?P<host>\S+) [^:]*: (?P<event>[A-Z][A-Z0-9_]+): (?P<msg>.*)$"
+    ),
+]
+INTERFACE_RE = [
+    re.compile(r"ifName (?P<intf>[\w\-/:.]+)"),
+    re.compile(r"for interface (?P<intf>[\w\-/:]+[\w])"),
+    re.compile(r"interface (?P<intf>[\w\-/:]+[\w])"),
+]
+
+
+def parseSyslog(line):
+    """Parse syslog line. Returns (hostname, event, interface) or None"""
+    for regex in SYSLOG_RE:
+        match = regex.match(line.strip())
+        if match:
+            break
+    if not match or match.group("event") not in EVENT_SUBSETS:
+        return None
+    intf = ""
+    for regex in INTERFACE_RE:
+        intfMatch = regex.search(match.group("msg"))
+        if intfMatch:
+            intf = intfMatch.group("intf").split(".")[0]
+            break
+    return match.group("host"), match.group("event"), intf
+
+
+class EventState:
+    """Dirty subsets/interfaces (set by listener) and cached facts per subset
+    (set by junos_facts) for a host"""
+
+    def __init__(self, host):
+        self.dirty = StateStore(host, "events")
+        self.facts = StateStore(host, "facts")
+
+    def mark(self, event, interface=""):
+        """Mark subsets (and interface) dirty for event"""
+        subsets, intfSubsets = EVENT_SUBSETS[event]
+        with self.dirty.locked():
+            for subset in subsets:
+                entry = self.dirty.get(subset, default={})
+                entry["all"] = True
+                self.dirty.set(subset, entry, save=False)
+            for subset in intfSubsets:
+                entry = self.dirty.get(subset, default={})
+                if interface:
+                    entry.setdefault("interfaces", [])
+                    if interface not in entry["interfaces"]:
+                        entry["interfaces"].append(interface)
+                else:
+                    entry["all"] = True
+                self.dirty.set(subset, entry, save=False)
+            self.dirty.save()
+
+    def getDirty(self, subset):
+        """Get dirty state of subset: {"all": bool, "interfaces": [...]}"""
+        return self.dirty.reload().get(subset, {}).get("value", {})
+
+    @staticmethod
+    def _factsKey(subset, scope):
+        """Cached facts key of subset and scope"""
+        return f"{subset}|{scope}" if scope else subset
+
+    def getFacts(self, subset, maxAge=0, scope=""):
+        """Get cached facts of subset and scope (None if missing or older than maxAge)"""
+        return self.facts.get(self._factsKey(subset, scope), ttl=maxAge)
+
+    def setFacts(self, subset, facts, started, scope=""):
+        """Cache subset facts and clear dirty state marked before started.
+        Facts of other scopes cached before the dirty mark are dropped"""
+        factsKey = self._factsKey(subset, scope)
+        # Listener (mark) writes events under the same lock
+        with self.dirty.locked(), self.facts.locked():
+            self.facts.set(factsKey, facts, save=False)
+            dirtyAt = self.dirty.getTimestamp(subset)
+            if dirtyAt and dirtyAt <= started:
+                for key in list(self.facts.load()):
+                    if (
+                        key != factsKey
+                        and key.split("|")[0] == subset
+                        and self.facts.getTimestamp(key) < dirtyAt
+                    ):
+                        self.facts.delete(key, save=False)
+                self.dirty.delete(subset)
+            self.facts.save()
+
+
+class SyslogHandler(socketserver.BaseRequestHandler):
+    """Handle syslog datagram"""
+
+    def handle(self):
+        data = self.request[0].decode("utf-8", errors="replace")
+        for line in data.splitlines():
+            parsed = parseSyslog(line)
+            if not parsed:
+                continue
+            hostname, event, intf = parsed
+            host = hostname if self.server.useHostname and hostname else self.client_address[0]
+            EventState(host).mark(event, intf)
+            if self.server.verbose:
+                print(f"[{time.time()}] {host} {event} {intf}")
+
+
+def serve(address="0.0.0.0", port=5514, useHostname=False, verbose=False):
+    """Run syslog listener"""
+    with socketserver.UDPServer((address, port), SyslogHandler) as server:
+        server.useHostname = useHostname
+        server.verbose = verbose
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Junos syslog event listener")
+    parser.add_argument("--address", default="0.0.0.0")
+    parser.add_argument("--port", default=5514, type=int)
+    parser.add_argument("--use-hostname", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+    serve(args.address, args.port, args.use_hostname, args.verbose)
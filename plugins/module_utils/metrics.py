@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""Prometheus export of module performance (node_exporter textfile collector).
+Copyright: Contributors to the SENSE Project
+GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+
+Values are collected by runwrapper timing hooks and accumulated per host and
+module in the state directory, so counters and histograms are monotonic across
+runs. Each run rewrites <metrics_dir>/sense_junos_<module>_<host>.prom in
+Prometheus text format 0.0.4 (what the textfile collector parses), so counter
+names carry the _total suffix in TYPE and samples alike.
+"""
+import json
+import os
+import re
+import time
+
+from ansible_collections.sense.junos.plugins.module_utils.statestore import (
+    StateStore, writeAtomic)
+
+PREFIX = "sense_junos"
+# Histogram buckets (seconds) for command, fact subset and commit durations
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Max distinct label values per metric family (others are reported as "other")
+MAX_LABEL_VALUES = 32
+
+# Device output parsers (qualname) whose runtime is reported as parse time
+PARSE_FUNCTIONS = frozenset(
+    [
+        "to_json",
+        "xml_to_json",
+        "parse_device_info",
+        "parse_commit_entry",
+        "Default.parse_mac_table",
+        "Default.parse_legacy_mac_table",
+        "Interfaces.parse_interfaces",
+        "Interfaces.parse_port_channels",
+        "Interfaces.parse_vlans",
+        "Interfaces.parse_lldp",
+        "InterfacesStatus.parse_status",
+        "Counters.parse_counters",
+    ]
+)
+COMMIT_FUNCTIONS = {"load_config": "commit", "commit_status": "commit_status"}
+
+# Command label normalization (keep label cardinality bounded)
+LABEL_REPLACE = [
+    (re.compile(r"\b[a-z]{2,4}-\d+/\d+/\d+(:\d+)?(\.\d+)?\b"), "<intf>"),
+    (re.compile(r"\b(ae|irb|vlan|lo)\d*\.\d+\b"), "<intf>"),
+    (re.compile(r"\b\d+(\.\d+){3}(/\d+)?\b"), "<ip>"),
+    (re.compile(r"\b\d+\b"), "<n>"),
+]
+
+FAMILIES = {
+    "command_duration_seconds": ("histogram", "Command execution time", "command"),
+    "command_bytes": ("counter", "Bytes read from device", "command"),
+    "parse_duration_seconds": ("summary", "Output parse time", "function"),
+    "commit_duration_seconds": ("histogram", "Commit duration", "operation"),
+    "fact_subset_duration_seconds": ("histogram", "Fact subset collection time", "subset"),
+    "command_retries": ("counter", "wait_for retries", ""),
+    "runs": ("counter", "Module runs", ""),
+    "failed_runs": ("counter", "Failed module runs (fail_json, errors and timeouts)", ""),
+}
+
+
+def commandLabel(command):
+    """Command label with interface names, addresses and numbers replaced"""
+    command = " ".join(str(command).split())
+    for regex, repl in LABEL_REPLACE:
+        command = regex.sub(repl, command)
+    return command
+
+
+def escapeLabel(value):
+    """Escape label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def formatValue(value):
+    """Format sample value"""
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Per host and module metrics"""
+
+    def __init__(self, host, module, outdir):
+        self.host = str(host)
+        self.module = module
+        safeHost = re.sub(r"[^\w.\-]", "_", self.host)
+        self.path = os.path.join(outdir, f"{PREFIX}_{module}_{safeHost}.prom")
+        self.state = StateStore(host, f"metrics_{module}")
+        self.data = self.state.get("metrics", default={})
+        self.gauges = {}
+
+    def _series(self, family, label):
+        """Get series of family, bounded to MAX_LABEL_VALUES labels"""
+        series = self.data.setdefault(family, {})
+        if label not in series and len(series) >= MAX_LABEL_VALUES:
+            label = "other"
+        return series, label
+
+    def inc(self, family, value=1, label=""):
+        """Increase counter"""
+        series, label = self._series(family, label)
+        series[label] = series.get(label, 0) + value
+
+    def observe(self, family, value, label=""):
+        """Add observation to histogram or summary"""
+        series, label = self._series(family, label)
+        entry = series.setdefault(label, {"sum": 0.0, "count": 0})
+        entry["sum"] += value
+        entry["count"] += 1
+        if FAMILIES[family][0] == "histogram":
+            buckets = entry.setdefault("buckets", [0] * len(DURATION_BUCKETS))
+            for idx, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    buckets[idx] += 1
+
+    def setGauge(self, name, value, helpText, labels=None):
+        """Set gauge (only for this run, not accumulated)"""
+        self.gauges.setdefault(name, (helpText, []))[1].append((labels or {}, value))
+
+    def hook(self, func, args, _kwargs, result, elapsed):
+        """runwrapper timing hook"""
+        name = func.__qualname__
+        if name == "exec_run_command":
+            label = commandLabel(args[1]["command"])
+            self.observe("command_duration_seconds", elapsed, label)
+            out = result[1] if isinstance(result, tuple) else ""
+            if isinstance(out, dict):
+                out = json.dumps(out)
+            if isinstance(out, str):
+                out = out.encode("utf-8", errors="surrogateescape")
+            self.inc("command_bytes", len(out or b""), label)
+        elif name == "collect_subset":
+            self.observe("fact_subset_duration_seconds", elapsed, args[1])
+        elif name in COMMIT_FUNCTIONS:
+            self.observe("commit_duration_seconds", elapsed, COMMIT_FUNCTIONS[name])
+        elif name in PARSE_FUNCTIONS:
+            self.observe("parse_duration_seconds", elapsed, name)
+
+    def _labels(self, labels):
+        """Format labels"""
+        labels = dict({"host": self.host, "module": self.module}, **labels)
+        return "{" + ",".join(f'{key}="{escapeLabel(val)}"' for key, val in labels.items()) + "}"
+
+    def render(self):
+        """Render metrics in Prometheus text format"""
+        lines = []
+        for family, (mtype, helpText, labelName) in FAMILIES.items():
+            name = f"{PREFIX}_{family}_total" if mtype == "counter" else f"{PREFIX}_{family}"
+            lines.append(f"# TYPE {name} {mtype}")
+            lines.append(f"# HELP {name} {helpText}")
+            for label, entry in sorted(self.data.get(family, {}).items()):
+                labels = {labelName: label} if labelName else {}
+                if mtype == "counter":
+                    lines.append(f"{name}{self._labels(labels)} {formatValue(entry)}")
+                    continue
+                if mtype == "histogram":
+                    for bound, count in zip(DURATION_BUCKETS, entry["buckets"]):
+                        bucketLabels = self._labels(dict(labels, le=formatValue(float(bound))))
+                        lines.append(f"{name}_bucket{bucketLabels} {count}")
+                    bucketLabels = self._labels(dict(labels, le="+Inf"))
+                    lines.append(f"{name}_bucket{bucketLabels} {entry['count']}")
+                lines.append(f"{name}_sum{self._labels(labels)} {formatValue(entry['sum'])}")
+                lines.append(f"{name}_count{self._labels(labels)} {entry['count']}")
+        for gauge, (helpText, samples) in sorted(self.gauges.items()):
+            name = f"{PREFIX}_{gauge}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"# HELP {name} {helpText}")
+            for labels, value in samples:
+                lines.append(f"{name}{self._labels(labels)} {formatValue(value)}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, failed=False):
+        """Save accumulated state and write metrics file atomically"""
+        self.inc("runs")
+        if failed:
+            self.inc("failed_runs")
+        self.setGauge("last_run_timestamp_seconds", time.time(), "Last module run")
+        self.state.set("metrics", self.data)
+        writeAtomic(self.path, self.render(), mode=0o644)
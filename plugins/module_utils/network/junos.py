@@ -4,22 +4,48 @@
 # Copyright: Contributors to the Ansible project
 # GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
 import json
+import math
+import re
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
 
 from ansible.utils.display import Display
 from ansible.module_utils._text import to_text
 from ansible.module_utils.basic import env_fallback
-from ansible.module_utils.connection import exec_command
+from ansible.module_utils.connection import (Connection, ConnectionError,
+                                             exec_command)
 from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.config import (
     ConfigLine, NetworkConfig)
 from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.utils import (
     ComplexList, to_list)
-from ansible_collections.sense.junos.plugins.module_utils.runwrapper import \
-    functionwrapper
+from ansible_collections.sense.junos.plugins.module_utils.admission import (
+    HELD_COMMIT_TTL, Admission, AdmissionTimeout, classify)
+from ansible_collections.sense.junos.plugins.module_utils.metrics import \
+    Metrics
+from ansible_collections.sense.junos.plugins.module_utils.runwrapper import (
+    addTimingHook, functionwrapper, removeTimingHook)
+from ansible_collections.sense.junos.plugins.module_utils.statestore import \
+    StateStore
 
 display = Display()
 
 _DEVICE_CONFIGS = {}
 
+# Chunk size used to feed XML replies to the streaming parser
+XML_CHUNK_SIZE = 65536
+
+# Latency history kept per command, min samples before timeout is adapted
+# and lowest adaptive timeout (seconds)
+LATENCY_SAMPLES = 100
+LATENCY_MIN_SAMPLES = 5
+LATENCY_MIN_TIMEOUT = 10
+# Command is reported as outlier if it took longer than p99 * factor
+LATENCY_OUTLIER_FACTOR = 2
+# Seconds between polls of a running (async) commit
+COMMIT_POLL_INTERVAL = 1
+
 WARNING_PROMPTS_RE = [
     r"[\r\n]?\[yes/no\]:\s?$",
     r"[\r\n]?\[confirm yes/no\]:\s?$",
@@ -45,7 +71,291 @@ junos_provider_spec = {
     },
     "timeout": {"type": "int"},
 }
-junos_argument_spec = {"provider": {"type": "dict", "options": junos_provider_spec}}
+junos_argument_spec = {
+    "provider": {"type": "dict", "options": junos_provider_spec},
+    "adaptive_timeout": {"type": "bool", "default": False},
+    "timeout_factor": {"type": "float", "default": 3.0},
+    "max_heavy_commands": {"type": "int", "default": 0},
+    "admission_timeout": {"type": "int", "default": 600},
+    "metrics_dir": {
+        "type": "path",
+        "fallback": (env_fallback, ["SENSE_JUNOS_METRICS_DIR"]),
+    },
+}
+
+# Switching commands differ between ELS (l2ng) and legacy (non ELS) Junos.
+# Style is taken from cached device info, so no probing is needed.
+# Platforms which never run ELS (any version); on others ELS starts with 13.2
+LEGACY_SWITCHING_MODELS = re.compile(
+    r"^(ex2200|ex3200|ex3300|ex4200|ex4500|ex4550|ex6200|ex8200|qfx3500|qfx3600)", re.I
+)
+ELS_MIN_VERSION = (13, 2)
+SWITCHING_COMMANDS = {
+    "l2ng": {
+        "mactable": "show ethernet-switching table detail | display json",
+        "vlans": "show vlans detail | display json",
+    },
+    "legacy": {
+        "mactable": "show ethernet-switching table extensive | display json",
+        "vlans": "show vlans extensive | display json",
+    },
+}
+
+
+@functionwrapper
+def get_connection(module):
+    """Get (and reuse) persistent connection of the module"""
+    if not hasattr(module, "_junos_connection"):
+        module._junos_connection = Connection(module._socket_path)
+        check_pending_commit(module)
+    return module._junos_connection
+
+
+@functionwrapper
+def check_pending_commit(module):
+    """Fail if an async commit is running on the connection. Any command sent
+    before the commit is collected (commit_handle) would consume its output"""
+    try:
+        pending = module._junos_connection.get_pending_commit()
+    except ConnectionError:
+        # netconf (no async commits)
+        return
+    handle = module.params.get("commit_handle") or {}
+    if pending and pending != handle.get("id"):
+        module.fail_json(
+            msg=f"commit {pending} is still running on this connection, "
+            "collect it first with junos_config commit_handle"
+        )
+
+
+@functionwrapper
+def get_switching_style(version, model=""):
+    """Get switching style (l2ng or legacy) from platform model and Junos version.
+    Parsers also check the output itself, so a wrong guess only costs the
+    cheaper command variant"""
+    if model and LEGACY_SWITCHING_MODELS.match(model):
+        return "legacy"
+    if not version or "EVO" in version:
+        return "l2ng"
+    match = re.match(r"^(\d+)\.(\d+)", version)
+    if not match:
+        return "l2ng"
+    return "l2ng" if tuple(map(int, match.groups())) >= ELS_MIN_VERSION else "legacy"
+
+
+@functionwrapper
+def parse_device_info(out):
+    """Parse show version | display json output to device info"""
+    devInfo = {"network_os": "sense.junos.junos"}
+    out = to_json(out) if isinstance(out, str) else out
+    if not isinstance(out, dict):
+        return devInfo
+    # Multi RE devices wrap software-information in multi-routing-engine-results
+    swinfo = out.get("software-information")
+    if not swinfo:
+        for reitem in out.get("multi-routing-engine-results", [{}])[0].get(
+            "multi-routing-engine-item", []
+        ):
+            swinfo = reitem.get("software-information")
+            if swinfo:
+                break
+    swinfo = (swinfo or [{}])[0]
+    for key, mapping in {
+        "junos-version": "network_os_version",
+        "product-model": "network_os_model",
+        "product-name": "network_os_platform",
+        "host-name": "network_os_hostname",
+    }.items():
+        tmpVal = swinfo.get(key, [{"": ""}])[0].get("data", "")
+        if tmpVal:
+            devInfo[mapping] = tmpVal
+    devInfo["network_os_switching"] = get_switching_style(
+        devInfo.get("network_os_version", ""), devInfo.get("network_os_model", "")
+    )
+    return devInfo
+
+
+@functionwrapper
+def get_device_info(module):
+    """Get device info (cached by cliconf plugin)"""
+    try:
+        return get_connection(module).get_device_info()
+    except ConnectionError as exc:
+        display.vvvv(f"unable to get device info: {exc}")
+        return {}
+
+
+@functionwrapper
+def get_switching_commands(module):
+    """Get switching commands matching device switching style"""
+    devInfo = get_device_info(module)
+    # Not taken from cached network_os_switching, it may predate model check
+    style = get_switching_style(
+        devInfo.get("network_os_version", ""), devInfo.get("network_os_model", "")
+    )
+    return style, SWITCHING_COMMANDS.get(style, SWITCHING_COMMANDS["l2ng"])
+
+
+@functionwrapper
+def encode_ranges(values):
+    """Encode integers to compact range string, e.g. [100, 101, 102, 300] -> 100-102,300"""
+    out = []
+    for value in sorted(set(int(val) for val in values)):
+        if out and out[-1][1] == value - 1:
+            out[-1][1] = value
+        else:
+            out.append([value, value])
+    return ",".join(f"{lo}-{hi}" if lo != hi else str(lo) for lo, hi in out)
+
+
+@functionwrapper
+def decode_ranges(ranges):
+    """Decode range string (e.g. 100-102,300) to set of integers"""
+    out = set()
+    for item in str(ranges).replace(" ", "").split(","):
+        if not item:
+            continue
+        if "-" in item:
+            lo, hi = item.split("-", 1)
+            out.update(range(int(lo), int(hi) + 1))
+        else:
+            out.add(int(item))
+    return out
+
+
+@functionwrapper
+def normalize_command(command):
+    """Normalize command (whitespace) to use it as a cache key"""
+    return " ".join(to_text(command, errors="surrogate_or_strict").split())
+
+
+@functionwrapper
+def invalidate_result_cache(module):
+    """Drop cached command results kept in the persistent connection"""
+    try:
+        get_connection(module).invalidate_cache()
+    except ConnectionError as exc:
+        display.vvvv(f"unable to invalidate result cache: {exc}")
+
+
+@functionwrapper
+def get_capabilities(module):
+    """Get (and reuse) connection capabilities"""
+    if not hasattr(module, "_junos_capabilities"):
+        try:
+            capabilities = json.loads(get_connection(module).get_capabilities())
+        except (ConnectionError, ValueError):
+            capabilities = {}
+        module._junos_capabilities = capabilities
+    return module._junos_capabilities
+
+
+@functionwrapper
+def is_netconf(module):
+    """Check if module runs over netconf connection"""
+    return get_capabilities(module).get("network_api") == "netconf"
+
+
+@functionwrapper
+def exec_rpc(module, rpc):
+    """Execute rpc (xml string) over netconf. Returns ret, reply, err"""
+    try:
+        return 0, get_connection(module).execute_rpc(rpc), ""
+    except ConnectionError as exc:
+        return 1, "", to_text(exc, errors="surrogate_then_replace")
+
+
+@functionwrapper
+def command_rpc(command, raw=False):
+    """Build <command> rpc for cli command.
+
+    Returns rpc, reply format and if reply must be converted to json.
+    `| display json` is requested as xml and converted (see xml_to_json),
+    with raw it is requested as json (raw json text is returned).
+    """
+    fmt, convert = "text", False
+    match = re.search(r"\|\s*display\s+(json|xml)\s*$", command)
+    if match:
+        fmt, convert = "xml", match.group(1) == "json"
+        if raw and convert:
+            fmt, convert = "json", False
+        command = command[: match.start()].strip()
+    elem = ET.Element("command", {"format": fmt})
+    elem.text = command
+    return ET.tostring(elem, encoding="unicode"), fmt, convert
+
+
+@functionwrapper
+def reply_text(reply):
+    """Get text content of rpc-reply (text and json format replies)"""
+    try:
+        return "".join(ET.fromstring(reply).itertext()).strip()
+    except ET.ParseError:
+        return reply
+
+
+@functionwrapper
+def exec_netconf_command(module, command, raw=False):
+    """Execute cli command as netconf <command> rpc. Returns ret, out, err.
+
+    With raw, output is returned as the device sent it: text, json text
+    (`| display json`) or rpc-reply xml (`| display xml`).
+    """
+    rpc, fmt, convert = command_rpc(command, raw)
+    ret, out, err = exec_rpc(module, rpc)
+    if ret != 0:
+        return ret, out, err
+    if fmt in ("text", "json"):
+        return ret, reply_text(out), err
+    return ret, xml_to_json(out) if convert else out, err
+
+
+@functionwrapper
+def netconf_config_rpc(module, rpc):
+    """Execute configuration rpc, fail module on rpc-error"""
+    ret, out, err = exec_rpc(module, rpc)
+    if ret != 0 or "<rpc-error" in to_text(out):
+        exec_rpc(module, "<close-configuration/>")
+        module.fail_json(msg="netconf rpc failed", rpc=rpc, stdout=out, stderr=err, rc=ret or 1)
+    return out
+
+
+@functionwrapper
+def netconf_load_candidate(module, commands):
+    """Open private configuration and load set commands over netconf"""
+    netconf_config_rpc(module, "<open-configuration><private/></open-configuration>")
+    config = ET.Element("load-configuration", {"action": "set", "format": "text"})
+    ET.SubElement(config, "configuration-set").text = "\n".join(
+        command for command in to_list(commands) if command != "commit and-quit"
+    )
+    netconf_config_rpc(module, ET.tostring(config, encoding="unicode"))
+
+
+@functionwrapper
+def netconf_commit(module, confirm=0, comment=None, check=False):
+    """Commit (or commit check) over netconf and close configuration"""
+    commit = ET.Element("commit-configuration")
+    if check:
+        ET.SubElement(commit, "check")
+    if confirm and not check:
+        ET.SubElement(commit, "confirmed")
+        ET.SubElement(commit, "confirm-timeout").text = str(int(confirm))
+    if comment and not check:
+        ET.SubElement(commit, "log").text = comment
+    out = netconf_config_rpc(module, ET.tostring(commit, encoding="unicode"))
+    return out
+
+
+@functionwrapper
+def get_device_host(module):
+    """Get device host name/address used as key for per host state"""
+    try:
+        host = get_connection(module).get_option("host")
+    except ConnectionError:
+        host = None
+    if not host:
+        host = (module.params.get("provider") or {}).get("host")
+    return host or "localhost"
 
 
 @functionwrapper
@@ -59,6 +369,68 @@ def to_json(out):
         return out
 
 
+def _strip_ns(tag):
+    """Remove namespace from XML tag"""
+    return re.sub(r"\{.*\}", "", tag)
+
+
+def _attr_name(key):
+    """Attribute name as in `| display json` (junos namespace is junos: prefix)"""
+    match = re.match(r"^\{([^}]*)\}(.*)$", key)
+    if not match:
+        return key
+    return f"junos:{match.group(2)}" if match.group(1).endswith("/junos") else match.group(2)
+
+
+@functionwrapper
+def xml_to_json(out):
+    """Convert `| display xml` (or netconf rpc-reply) output to the same
+    structure as `| display json`, so parsers can consume either format.
+
+    Output is parsed as a stream (XMLPullParser fed in XML_CHUNK_SIZE
+    chunks) and elements are dropped as soon as they are converted.
+    Returns output unchanged if it is not XML.
+    """
+    if not isinstance(out, str) or "<" not in out:
+        return out
+    xml = out[out.find("<") : out.rfind(">") + 1]
+    parser = ET.XMLPullParser(events=("start", "end"))
+    stack = [{}]
+    try:
+        for idx in range(0, len(xml), XML_CHUNK_SIZE):
+            parser.feed(xml[idx : idx + XML_CHUNK_SIZE])
+            for event, elem in parser.read_events():
+                if event == "start":
+                    node = {}
+                    if elem.attrib:
+                        node["attributes"] = {
+                            _attr_name(key): val for key, val in elem.attrib.items()
+                        }
+                    stack[-1].setdefault(_strip_ns(elem.tag), []).append(node)
+                    stack.append(node)
+                    continue
+                node = stack.pop()
+                if not [key for key in node if key != "attributes"]:
+                    text = (elem.text or "").strip()
+                    node["data"] = text if text else [None]
+                elem.clear()
+        parser.close()
+    except ET.ParseError:
+        return out
+    result = stack[0]
+    if "rpc-reply" in result:
+        result = result["rpc-reply"][0]
+        result.pop("cli", None)
+        result.pop("attributes", None)
+    return result
+
+
+@functionwrapper
+def set_command_format(command, fmt):
+    """Change `| display json|xml` of command to given format"""
+    return re.sub(r"\|\s*display\s+(json|xml)\s*$", f"| display {fmt}", command)
+
+
 @functionwrapper
 def check_args(module, warnings):
     """Check args pass"""
@@ -76,7 +448,14 @@ def get_config(module, flags=None):
     try:
         return _DEVICE_CONFIGS[cmd]
     except KeyError:
-        ret, out, err = exec_command(module, cmd)
+        with admit(module, cmd, "heavy"):
+            if is_netconf(module):
+                ret, out, err = exec_rpc(module, '<get-configuration format="text"/>')
+                if ret == 0 and "<rpc-error" in to_text(out):
+                    ret, err = 1, out
+                out = reply_text(out) if ret == 0 else out
+            else:
+                ret, out, err = exec_command(module, cmd)
         if ret != 0:
             module.fail_json(
                 msg="unable to retrieve current config",
@@ -96,18 +475,270 @@ def to_commands(module, commands):
 
 
 @functionwrapper
-def run_commands(module, commands, check_rc=True):
-    """Run Commands"""
+def exec_cached(module, command, cache_ttl):
+    """Execute show command via result cache of the persistent connection.
+    module._junos_cache_hit tells if output was answered from cache"""
+    try:
+        reply = get_connection(module).get_cached(command, cache_ttl, True)
+        module._junos_cache_hit = reply["hit"]
+        return 0, reply["output"], ""
+    except ConnectionError as exc:
+        return 1, "", to_text(exc, errors="surrogate_then_replace")
+
+
+def percentile(values, pct):
+    """Get percentile (nearest rank) of values"""
+    values = sorted(values)
+    return values[max(0, math.ceil(pct / 100.0 * len(values)) - 1)]
+
+
+@functionwrapper
+def get_latency_store(module):
+    """Get per host command latency history store"""
+    if not hasattr(module, "_junos_latency"):
+        module._junos_latency = StateStore(get_device_host(module), "latency")
+        module._junos_outliers = []
+    return module._junos_latency
+
+
+@functionwrapper
+def get_latency_outliers(module):
+    """Get commands which took much longer than p99 of their latency history"""
+    return getattr(module, "_junos_outliers", [])
+
+
+@functionwrapper
+def get_command_timeout(module, command):
+    """Get timeout derived from latency history: p99 * timeout_factor.
+    None if there is not enough history"""
+    samples = get_latency_store(module).get(normalize_command(command), default=[])
+    if len(samples) < LATENCY_MIN_SAMPLES:
+        return None
+    return max(
+        LATENCY_MIN_TIMEOUT,
+        int(math.ceil(percentile(samples, 99) * module.params["timeout_factor"])),
+    )
+
+
+@functionwrapper
+def set_command_timeout(module, timeout):
+    """Set persistent_command_timeout of the connection"""
+    try:
+        conn = get_connection(module)
+        if not hasattr(module, "_junos_default_timeout"):
+            module._junos_default_timeout = conn.get_option("persistent_command_timeout")
+        # Not set_options(direct=...), it resets all other options (host, user)
+        conn.set_option(
+            "persistent_command_timeout", timeout or module._junos_default_timeout
+        )
+    except ConnectionError as exc:
+        display.vvvv(f"unable to set command timeout: {exc}")
+
+
+@functionwrapper
+def record_latency(module, command, elapsed, timeout=None):
+    """Record command latency (saved with save_latency), report outliers"""
+    store = get_latency_store(module)
+    key = normalize_command(command)
+    samples = store.get(key, default=[])
+    if (
+        len(samples) >= LATENCY_MIN_SAMPLES
+        and elapsed > percentile(samples, 99) * LATENCY_OUTLIER_FACTOR
+    ):
+        module._junos_outliers.append(
+            {
+                "command": key,
+                "elapsed": round(elapsed, 3),
+                "p99": round(percentile(samples, 99), 3),
+                "timeout": timeout,
+            }
+        )
+    samples.append(round(elapsed, 3))
+    store.set(key, samples[-LATENCY_SAMPLES:], save=False)
+
+
+@functionwrapper
+def save_latency(module):
+    """Save latency history"""
+    if hasattr(module, "_junos_latency"):
+        try:
+            module._junos_latency.save()
+        except OSError as exc:
+            display.vvvv(f"unable to save latency history: {exc}")
+
+
+@functionwrapper
+def get_admission(module):
+    """Get admission control of the device"""
+    return Admission(
+        get_device_host(module),
+        module.params["max_heavy_commands"],
+        module.params["admission_timeout"],
+    )
+
+
+@functionwrapper
+def hold_commit_slot(module, handle):
+    """Keep commit admission for async commit until commit_status collects it
+    (or admission_timeout passes, if it is never collected)"""
+    if not module.params.get("max_heavy_commands"):
+        return
+    ttl = module.params["admission_timeout"] or HELD_COMMIT_TTL
+    get_admission(module).holdCommit(handle["id"], ttl)
+    handle["admission"] = True
+
+
+@functionwrapper
+def release_commit_slot(module, handle):
+    """Release commit admission kept by hold_commit_slot"""
+    if handle.get("admission") and module.params.get("max_heavy_commands"):
+        get_admission(module).releaseCommit(handle["id"])
+
+
+@contextmanager
+def admit(module, command, kind=None):
+    """Wait for device admission (heavy command slot or commit lock).
+
+    Disabled unless max_heavy_commands is set. Waits are recorded and
+    returned by get_admission_waits.
+    """
+    kind = kind or classify(command)
+    if not module.params.get("max_heavy_commands") or kind == "light":
+        yield
+        return
+    admission = get_admission(module)
+    try:
+        waited = admission.acquire(kind)
+    except AdmissionTimeout as exc:
+        module.fail_json(msg=str(exc), command=command)
+    if not hasattr(module, "_junos_admission"):
+        module._junos_admission = []
+    module._junos_admission.append(
+        {"command": normalize_command(command), "kind": kind, "wait": round(waited, 3)}
+    )
+    try:
+        yield
+    finally:
+        admission.release()
+
+
+@functionwrapper
+def get_admission_waits(module):
+    """Get queue wait times of heavy commands and commits"""
+    return getattr(module, "_junos_admission", [])
+
+
+def start_metrics(module, name):
+    """Start collecting metrics of module run (if metrics_dir is set)"""
+    if not module.params.get("metrics_dir") or getattr(module, "_junos_metrics", None):
+        return
+    module._junos_metrics = Metrics(get_device_host(module), name, module.params["metrics_dir"])
+    addTimingHook(module._junos_metrics.hook)
+    failJson = module.fail_json
+
+    def fail_json(**kwargs):
+        """Write metrics of failed run (errors, timeouts, wait_for) and fail"""
+        write_metrics(module, failed=True)
+        failJson(**kwargs)
+
+    module.fail_json = fail_json
+
+
+def get_metrics(module):
+    """Get metrics of module run (None if not collected)"""
+    return getattr(module, "_junos_metrics", None)
+
+
+def write_metrics(module, failed=False):
+    """Write collected metrics (with result cache stats of the connection)"""
+    metrics = get_metrics(module)
+    if not metrics:
+        return
+    removeTimingHook(metrics.hook)
+    module._junos_metrics = None
+    if not is_netconf(module):
+        try:
+            stats = get_connection(module).get_cache_stats()
+        except ConnectionError:
+            stats = {}
+        if stats:
+            requests = stats["hits"] + stats["misses"]
+            metrics.setGauge("result_cache_hits", stats["hits"], "Result cache hits")
+            metrics.setGauge("result_cache_misses", stats["misses"], "Result cache misses")
+            metrics.setGauge(
+                "result_cache_hit_ratio",
+                round(stats["hits"] / requests, 4) if requests else 0.0,
+                "Result cache hit ratio",
+            )
+    try:
+        metrics.write(failed)
+    except OSError as exc:
+        module.warn(f"unable to write metrics: {exc}")
+
+
+@functionwrapper
+def exec_run_command(module, cmd, cache_ttl=0, raw=False):
+    """Execute single command (netconf, result cache or cli)"""
+    if is_netconf(module):
+        return exec_netconf_command(module, cmd["command"], raw)
+    if cache_ttl and not cmd.get("prompt") and cmd["command"].startswith("show "):
+        return exec_cached(module, cmd["command"], cache_ttl)
+    return exec_command(module, module.jsonify(cmd))
+
+
+@functionwrapper
+def exec_command_to_file(module, command, path):
+    """Run command and let the connection write its raw output to path, so
+    the output is never loaded by the module. Returns path, bytes, sha256"""
+    try:
+        with admit(module, command):
+            if is_netconf(module):
+                rpc, _fmt, _convert = command_rpc(command)
+                return get_connection(module).execute_rpc_to_file(rpc, path)
+            return get_connection(module).get_to_file(command, path)
+    except ConnectionError as exc:
+        module.fail_json(
+            msg=to_text(exc, errors="surrogate_then_replace"), command=command
+        )
+
+
+@functionwrapper
+def run_commands(module, commands, check_rc=True, cache_ttl=0, raw=False):
+    """Run Commands.
+
+    With cache_ttl, show commands are answered from the per host result
+    cache (kept in the persistent connection) if not older than cache_ttl.
+    With raw, output is returned as text (not converted to json).
+    With adaptive_timeout, each command gets a timeout derived from its
+    latency history (see get_command_timeout).
+    """
     responses = []
     commands = to_commands(module, to_list(commands))
+    adaptive = module.params.get("adaptive_timeout")
     for cmd in commands:
-        cmd = module.jsonify(cmd)
-        ret, out, err = exec_command(module, cmd)
+        timeout = get_command_timeout(module, cmd["command"]) if adaptive else None
+        if timeout:
+            set_command_timeout(module, timeout)
+        module._junos_cache_hit = False
+        with admit(module, cmd["command"]):
+            startTime = time.perf_counter()
+            ret, out, err = exec_run_command(module, cmd, cache_ttl, raw)
+        if timeout:
+            set_command_timeout(module, None)
+        if not module._junos_cache_hit:
+            record_latency(module, cmd["command"], time.perf_counter() - startTime, timeout)
         if check_rc and ret != 0:
+            save_latency(module)
             module.fail_json(msg=to_text(err, errors="surrogate_or_strict"), rc=ret)
-        responses.append(to_json(to_text(out, errors="surrogate_or_strict")))
+        if isinstance(out, dict):
+            responses.append(out)
+            continue
+        out = to_text(out, errors="surrogate_or_strict")
+        responses.append(out if raw else to_json(out))
+    save_latency(module)
     return responses
 
+
 @functionwrapper
 def check_commit(module, ret, out, err):
     """Check if commit was successful"""
@@ -119,8 +750,8 @@ def check_commit(module, ret, out, err):
 
 
 @functionwrapper
-def load_config(module, commands):
-    """Load config"""
+def load_candidate(module, commands):
+    """Enter private configuration mode and load commands into candidate"""
     ret, _out, err = exec_command(module, "configure private")
     if ret != 0:
         module.fail_json(
@@ -136,9 +767,240 @@ def load_config(module, commands):
             module.fail_json(
                 msg=to_text(err, errors="surrogate_or_strict"), command=command, rc=ret
             )
-    if not module.check_mode:
-        ret, out, err = exec_command(module, "commit and-quit")
+
+
+@functionwrapper
+def get_device_diff(module, commands):
+    """Load candidate in private mode, diff it on device and roll it back.
+
+    Returns output of `show | compare`. Candidate is validated with
+    `commit check` and discarded afterwards, so nothing is committed.
+    """
+    with admit(module, "show | compare", "heavy"):
+        if is_netconf(module):
+            netconf_load_candidate(module, commands)
+            reply = netconf_config_rpc(
+                module,
+                '<get-configuration compare="rollback" rollback="0" format="text"/>',
+            )
+            reply = xml_to_json(reply)
+            diff = ""
+            if isinstance(reply, dict):
+                diff = reply.get("configuration-information", [{}])[0].get(
+                    "configuration-output", [{"data": ""}]
+                )[0].get("data", "")
+            netconf_commit(module, check=True)
+            exec_rpc(module, "<discard-changes/>")
+            exec_rpc(module, "<close-configuration/>")
+            return diff.strip() if isinstance(diff, str) else ""
+        try:
+            load_candidate(module, commands)
+            ret, out, err = exec_command(module, "show | compare")
+            if ret != 0:
+                module.fail_json(
+                    msg="unable to get diff from device",
+                    err=to_text(err, errors="surrogate_or_strict"),
+                )
+            diff = to_text(out, errors="surrogate_or_strict").strip()
+            ret, chk, err = exec_command(module, "commit check")
+        finally:
+            # Also if load or compare failed, private configuration is not left open
+            exec_command(module, "rollback 0")
+            exec_command(module, "exit configuration-mode")
+        chk = to_text(chk, errors="surrogate_or_strict")
+        err = to_text(err, errors="surrogate_or_strict")
+        if ret != 0 or "error: " in chk or "error: " in err:
+            module.fail_json(
+                msg="commit check failed on device", stdout=chk, stderr=err, diff=diff
+            )
+        return diff
+
+
+@functionwrapper
+def load_config(module, commands, commit_async=False, confirm=0, comment=None):
+    """Load config.
+
+    With commit_async the commit is only started and a handle is returned,
+    which must be passed to commit_status to collect the commit result.
+    Result cache is invalidated by start_commit, the commit slot is kept
+    (hold_commit_slot) until commit_status releases it.
+    """
+    with admit(module, "commit", "commit"):
+        if is_netconf(module):
+            return netconf_load_config(module, commands, commit_async, confirm, comment)
+        load_candidate(module, commands)
+        if module.check_mode:
+            return None
+        if commit_async:
+            handle = start_commit(module, confirm, comment)
+            hold_commit_slot(module, handle)
+            return handle
+        ret, out, err = exec_command(module, commit_command(confirm, comment))
         check_commit(module, ret, out, err)
+    invalidate_result_cache(module)
+    return None
+
+
+@functionwrapper
+def netconf_load_config(module, commands, commit_async=False, confirm=0, comment=None):
+    """Load config over netconf (load-configuration, commit-configuration)"""
+    netconf_load_candidate(module, commands)
+    if module.check_mode:
+        exec_rpc(module, "<close-configuration/>")
+        return None
+    if commit_async:
+        module.warn("commit_async is not supported over netconf, committing synchronously")
+    netconf_commit(module, confirm, comment)
+    exec_rpc(module, "<close-configuration/>")
+    return None
+
+
+@functionwrapper
+def commit_command(confirm=0, comment=None):
+    """Build commit and-quit command"""
+    cmd = "commit"
+    if confirm:
+        cmd += f" confirmed {int(confirm)}"
+    if comment:
+        cmd += f' comment "{comment}"'
+    return cmd + " and-quit"
+
+
+@functionwrapper
+def get_device_time(module):
+    """Get device clock (epoch seconds) in configuration mode, None if unknown"""
+    _ret, out, _err = exec_command(module, "run show system uptime | display json")
+    out = to_text(out, errors="surrogate_or_strict")
+    out = to_json(out[: out.rfind("}") + 1])
+    try:
+        uptime = out["system-uptime-information"][0]["current-time"][0]
+        return int(uptime["date-time"][0]["attributes"]["junos:seconds"])
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+
+
+@functionwrapper
+def start_commit(module, confirm=0, comment=None):
+    """Validate candidate and start commit without waiting for it to finish.
+
+    Commit output is kept by the connection until commit_status collects it,
+    other commands on the connection are refused until then.
+    """
+    ret, out, err = exec_command(module, "commit check")
+    check_commit(module, ret, out, err)
+    handle = {
+        "id": comment or f"sense-{uuid.uuid4().hex[:12]}",
+        "started": time.time(),
+        "device_started": get_device_time(module),
+        "confirm": int(confirm or 0),
+    }
+    # Cached results are pre-commit data from now on
+    invalidate_result_cache(module)
+    try:
+        get_connection(module).start_commit(handle["id"], commit_command(confirm, handle["id"]))
+    except ConnectionError as exc:
+        module.fail_json(
+            msg="unable to start commit", err=to_text(exc, errors="surrogate_then_replace")
+        )
+    return handle
+
+
+@functionwrapper
+def parse_commit_entry(entry):
+    """Parse commit history entry (show system commit | display json)"""
+    datetime = entry.get("date-time", [{"": ""}])[0]
+    try:
+        seconds = int(datetime.get("attributes", {}).get("junos:seconds"))
+    except (TypeError, ValueError):
+        seconds = None
+    return {
+        "sequence": entry.get("sequence-number", [{"": ""}])[0].get("data", ""),
+        "date_time": datetime.get("data", ""),
+        "seconds": seconds,
+        "user": entry.get("user", [{"": ""}])[0].get("data", ""),
+    }
+
+
+@functionwrapper
+def get_commit_entries(module):
+    """Get commit history entries (newest first)"""
+    responses = run_commands(module, "show system commit | display json", check_rc=False)
+    if not responses or not isinstance(responses[0], dict):
+        return []
+    return responses[0].get("commit-information", [{}])[0].get("commit-history", [])
+
+
+@functionwrapper
+def get_commit_history(module, comment):
+    """Get commit history entry (show system commit) with a given comment"""
+    for entry in get_commit_entries(module):
+        log = entry.get("log", [{"": ""}])[0].get("data", "")
+        if log == comment:
+            return parse_commit_entry(entry)
+    return {}
+
+
+@functionwrapper
+def get_last_commit(module):
+    """Get last commit (date_time and user identify it, sequence of the
+    last commit is always 0)"""
+    entries = get_commit_entries(module)
+    return parse_commit_entry(entries[0]) if entries else {}
+
+
+@functionwrapper
+def commit_status(module, handle, confirm_commit=False, wait=0):
+    """Poll commit started with start_commit.
+
+    Polls every COMMIT_POLL_INTERVAL for up to wait seconds (once if 0) and
+    returns done False if the commit is still running, so the same handle
+    can be polled again later. Duration is taken from device clock (start
+    time in handle, commit time from commit history). If the commit was
+    started with confirmed N, it is confirmed when confirm_commit is set,
+    otherwise the device rolls it back automatically after N minutes.
+    """
+    if is_netconf(module):
+        module.fail_json(msg="commit_handle is only supported over network_cli")
+    deadline = time.time() + wait
+    while True:
+        try:
+            poll = get_connection(module).poll_commit(handle["id"])
+        except ConnectionError as exc:
+            module.fail_json(
+                msg="unable to poll commit status",
+                err=to_text(exc, errors="surrogate_then_replace"),
+                commit_handle=handle,
+            )
+        if poll["done"] or time.time() >= deadline:
+            break
+        time.sleep(COMMIT_POLL_INTERVAL)
+    status = {
+        "id": handle["id"],
+        "done": poll["done"],
+        "output": poll["output"],
+        "duration": None,
+        "confirmed": False,
+        "rollback_pending": bool(handle.get("confirm")),
+    }
+    if not poll["done"]:
+        return status
+    release_commit_slot(module, handle)
+    if poll["known"]:
+        check_commit(module, 0, poll["output"], "")
+    invalidate_result_cache(module)
+    entry = get_commit_history(module, handle["id"])
+    if not entry and not poll["known"]:
+        # Output lost (connection restarted) and commit not in history
+        module.fail_json(msg=f"commit {handle['id']} not found", commit_handle=handle)
+    status.update(entry)
+    if entry.get("seconds") and handle.get("device_started"):
+        status["duration"] = entry["seconds"] - handle["device_started"]
+    if handle.get("confirm") and confirm_commit:
+        load_config(module, [], comment=f"{handle['id']} confirmed")
+        status["confirmed"] = True
+        status["rollback_pending"] = False
+    return status
+
 
 @functionwrapper
 def get_sublevel_config(running_config, module):
@@ -162,6 +1024,76 @@ def get_sublevel_config(running_config, module):
 
     return sublevel_config
 
+class MacIndex:
+    """MAC address index. MACs are stored as integers, mapped to a set of
+    (interface, vlan, source) and per vlan to a set of MACs."""
+
+    def __init__(self):
+        self.macs = {}
+        self.vlans = {}
+
+    @staticmethod
+    def toInt(mac):
+        """Convert MAC (aa:bb:.., aa-bb-.., aabb.cc..) to integer"""
+        return int(mac.replace(":", "").replace("-", "").replace(".", ""), 16)
+
+    @staticmethod
+    def toStr(macint):
+        """Convert integer to MAC string aa:bb:cc:dd:ee:ff"""
+        mac = f"{macint:012x}"
+        return ":".join(mac[idx : idx + 2] for idx in range(0, 12, 2))
+
+    def add(self, mac, interface="", vlan="", source=""):
+        """Add MAC. Returns integer key (None if MAC is not valid)"""
+        try:
+            key = self.toInt(mac)
+        except (AttributeError, ValueError):
+            return None
+        self.macs.setdefault(key, set()).add((interface, str(vlan), source))
+        if vlan:
+            self.vlans.setdefault(str(vlan), set()).add(key)
+        return key
+
+    def merge(self, other):
+        """Merge other MacIndex into this one"""
+        for key, entries in other.macs.items():
+            self.macs.setdefault(key, set()).update(entries)
+        for vlan, keys in other.vlans.items():
+            self.vlans.setdefault(vlan, set()).update(keys)
+
+    def load(self, serialized):
+        """Load entries from serialize() output"""
+        for mac, entries in serialized.items():
+            for entry in entries:
+                self.add(mac, *entry)
+
+    def lookup(self, mac):
+        """Get list of (interface, vlan, source) for MAC"""
+        try:
+            return sorted(self.macs.get(self.toInt(mac), []))
+        except (AttributeError, ValueError):
+            return []
+
+    def getMacs(self, source=None):
+        """Get all MACs (optionally only from a given source)"""
+        return [
+            self.toStr(key)
+            for key in sorted(self.macs)
+            if not source or any(entry[2] == source for entry in self.macs[key])
+        ]
+
+    def getVlanMacs(self, vlan):
+        """Get MACs learned in vlan"""
+        return [self.toStr(key) for key in sorted(self.vlans.get(str(vlan), []))]
+
+    def serialize(self):
+        """Serialize to compact dict: mac -> [[interface, vlan, source], ...]"""
+        return {
+            self.toStr(key): [list(entry) for entry in sorted(self.macs[key])]
+            for key in sorted(self.macs)
+        }
+
+
 class ExceptionTemplate(Exception):
     """Exception template."""
     def __call__(self, *args):
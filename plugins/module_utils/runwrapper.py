@@ -16,6 +16,31 @@ from ansible.utils.display import Display
 
 display = Display()
 
+# Timing hooks, called as hook(func, args, kwargs, result, elapsed) after each
+# wrapped function call (see addTimingHook)
+TIMING_HOOKS = []
+
+
+def addTimingHook(hook):
+    """Register timing hook"""
+    if hook not in TIMING_HOOKS:
+        TIMING_HOOKS.append(hook)
+
+
+def removeTimingHook(hook):
+    """Unregister timing hook"""
+    if hook in TIMING_HOOKS:
+        TIMING_HOOKS.remove(hook)
+
+
+def callTimingHooks(func, args, kwargs, result, elapsed):
+    """Call registered timing hooks (hook errors never fail wrapped call)"""
+    for hook in list(TIMING_HOOKS):
+        try:
+            hook(func, args, kwargs, result, elapsed)
+        except Exception as ex:
+            display.vvvv(f"[WRAPPER] Timing hook {hook} failed: {ex}")
+
 
 def functionwrapper(func):
     """Function wrapper to print start/runtime/end"""
@@ -33,6 +58,11 @@ def functionwrapper(func):
                 f"[WRAPPER][{time.time()}] Function {func.__qualname__} {args} {kwargs} Took {total_time:.4f} seconds"
             )
             display.vvvvvv(f"[WRAPPER][{time.time()}] Leave {func.__qualname__}")
+            callTimingHooks(func, args, kwargs, result, total_time)
+        elif TIMING_HOOKS:
+            start_time = time.perf_counter()
+            result = func(*args, **kwargs)
+            callTimingHooks(func, args, kwargs, result, time.perf_counter() - start_time)
         else:
             result = func(*args, **kwargs)
         return result
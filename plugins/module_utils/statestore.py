@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Small per host state store (json files) kept on the controller.
+Copyright: Contributors to the SENSE Project
+GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+"""
+import fcntl
+import json
+import os
+import re
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Directory can be changed with SENSE_JUNOS_STATE_DIR env variable
+STATE_DIR_ENV = "SENSE_JUNOS_STATE_DIR"
+
+
+def getStateDir():
+    """Get state directory"""
+    return os.environ.get(
+        STATE_DIR_ENV, os.path.join(os.path.expanduser("~"), ".ansible", "sense_junos")
+    )
+
+
+def writeAtomic(path, data, mode=None):
+    """Write data (str or bytes) to file atomically (tmp file + rename).
+    mode sets file permissions (tmp files are created with 0600)"""
+    dirname = os.path.dirname(path)
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(prefix=".tmp_", dir=dirname)
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, bytes) else "w") as fobj:
+            fobj.write(data)
+        if mode is not None:
+            os.chmod(tmppath, mode)
+        os.replace(tmppath, path)
+    except Exception:
+        if os.path.exists(tmppath):
+            os.unlink(tmppath)
+        raise
+
+
+class StateStore:
+    """Json document per host and name. Keys are stored with timestamp,
+    so values can be read back with a ttl."""
+
+    def __init__(self, host, name, statedir=None):
+        host = re.sub(r"[^\w.\-]", "_", str(host or "localhost"))
+        self.dirname = os.path.join(statedir or getStateDir(), host)
+        self.path = os.path.join(self.dirname, f"{name}.json")
+        self.data = None
+
+    def load(self):
+        """Load state from file (empty dict if missing or broken)"""
+        if self.data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as fd:
+                    self.data = json.load(fd)
+            except (OSError, ValueError):
+                self.data = {}
+        return self.data
+
+    @contextmanager
+    def locked(self):
+        """Hold exclusive lock of the state file (read-modify-write shared with
+        other processes). State is reloaded once the lock is held"""
+        os.makedirs(self.dirname, exist_ok=True)
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self.reload()
+            yield self
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def reload(self):
+        """Drop in memory copy and load state from file again"""
+        self.data = None
+        return self.load()
+
+    def save(self):
+        """Save state to file"""
+        writeAtomic(self.path, json.dumps(self.load(), separators=(",", ":")))
+
+    def get(self, key, ttl=0, default=None):
+        """Get value. If ttl is set, values older than ttl are ignored"""
+        entry = self.load().get(key)
+        if not entry:
+            return default
+        if ttl and time.time() - entry.get("timestamp", 0) > ttl:
+            return default
+        return entry.get("value", default)
+
+    def getTimestamp(self, key):
+        """Get time when value was set (0 if missing)"""
+        return (self.load().get(key) or {}).get("timestamp", 0)
+
+    def set(self, key, value, save=True):
+        """Set value (with current timestamp)"""
+        self.load()[key] = {"timestamp": time.time(), "value": value}
+        if save:
+            self.save()
+
+    def delete(self, key, save=True):
+        """Delete value"""
+        self.load().pop(key, None)
+        if save:
+            self.save()
@@ -14,6 +14,12 @@ from __future__ import absolute_import, division, print_function
 
 __metaclass__ = type
 
+import hashlib
+import json
+import os
+import random
+import re
+import tempfile
 import time
 
 from ansible.module_utils.basic import AnsibleModule
@@ -24,7 +30,9 @@ from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.p
 from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.utils import \
     ComplexList
 from ansible_collections.sense.junos.plugins.module_utils.network.junos import (
-    check_args, junos_argument_spec, run_commands)
+    check_args, exec_command_to_file, get_admission_waits, get_latency_outliers,
+    get_metrics, is_netconf, junos_argument_spec, run_commands, start_metrics,
+    write_metrics)
 from ansible_collections.sense.junos.plugins.module_utils.runwrapper import \
     functionwrapper
 
@@ -40,6 +48,129 @@ def toLines(stdout):
         yield item
 
 
+@functionwrapper
+def toBytes(item):
+    """Response to bytes (json dump for structured output)"""
+    if isinstance(item, string_types):
+        return str(item).encode("utf-8", errors="replace")
+    return json.dumps(item, separators=(",", ":")).encode("utf-8")
+
+
+@functionwrapper
+def toFile(module, command, outdir):
+    """Run command with raw output written to file by the connection (output
+    is never loaded by the module). Returns its path, size and checksum"""
+    match = re.search(r"\|\s*display\s+(json|xml)\s*$", command)
+    suffix = f".{match.group(1)}" if match else ".txt"
+    if is_netconf(module):
+        # Raw netconf reply (rpc-reply xml)
+        suffix = ".xml"
+    fd, path = tempfile.mkstemp(prefix="junos_command_", suffix=suffix, dir=outdir)
+    os.close(fd)
+    return exec_command_to_file(module, command, path)
+
+
+@functionwrapper
+def toSummary(item, max_bytes):
+    """Truncate response to max_bytes, keep size and checksum of full output.
+    Full response is already loaded (and parsed), this only bounds result size"""
+    data = toBytes(item)
+    if not max_bytes or len(data) <= max_bytes:
+        return item, {"bytes": len(data), "truncated": False}
+    summary = {
+        "bytes": len(data),
+        "truncated": True,
+        "sha256": hashlib.sha256(data).hexdigest(),
+    }
+    return data[:max_bytes].decode("utf-8", errors="ignore"), summary
+
+
+@functionwrapper
+def format_output(module, commands, responses):
+    """Format responses according to output mode. Only file mode bounds module
+    memory (commands are run again, output goes straight to file), other modes
+    bound the size of returned result"""
+    mode = module.params["output"]
+    if mode == "full":
+        return {"stdout": responses, "stdout_lines": list(toLines(responses))}
+    if mode == "stdout":
+        return {"stdout": responses}
+    if mode == "json":
+        if any(isinstance(item, string_types) for item in responses):
+            module.warn("Output mode json drops non structured (string) responses")
+        return {
+            "stdout": [
+                None if isinstance(item, string_types) else item for item in responses
+            ]
+        }
+    if mode == "summary":
+        out = [toSummary(item, module.params["max_bytes"]) for item in responses]
+        return {
+            "stdout": [item[0] for item in out],
+            "stdout_summary": [item[1] for item in out],
+        }
+    # file
+    outdir = module.params["output_dir"] or tempfile.gettempdir()
+    return {"stdout_files": [toFile(module, cmd["command"], outdir) for cmd in commands]}
+
+
+@functionwrapper
+def conditional_index(conditional):
+    """Get index of command referenced by conditional (result[N]...)"""
+    match = re.match(r"result\[(\d+)\]", conditional.key)
+    return int(match.group(1)) if match else None
+
+
+@functionwrapper
+def needed_commands(commands, conditionals):
+    """Get command indexes still needed to evaluate remaining conditionals"""
+    indexes = set()
+    for item in conditionals:
+        index = conditional_index(item)
+        if index is None or index >= len(commands):
+            return list(range(len(commands)))
+        indexes.add(index)
+    return sorted(indexes)
+
+
+# Values which can not be passed to (or mean a narrower match in) junos | match.
+# Anchors are rejected for matches too: | match tests each line, so ^ and $
+# anchor to a line there, but to the whole output in the local conditional
+FILTER_UNSAFE = {
+    "contains": re.compile(r'["\\\n\[\](){}*+?|^$]'),
+    "matches": re.compile(r'["\\\n{}^$]|\(\?'),
+}
+
+
+@functionwrapper
+def to_probe(commands, conditional):
+    """Translate conditional on text output into device side filter
+    (command | match "value"). Device returns only matching lines, conditional
+    is still evaluated locally on them. Returns None if not translatable"""
+    index = conditional_index(conditional)
+    if index is None or index >= len(commands) or conditional.key != f"result[{index}]":
+        return None
+    command = commands[index]
+    if command.get("prompt") or "display" in command["command"]:
+        return None
+    oper = conditional.func.__name__
+    value = str(conditional.value)
+    if oper not in FILTER_UNSAFE or not value or FILTER_UNSAFE[oper].search(value):
+        return None
+    return f'{command["command"]} | match "{value}"'
+
+
+@functionwrapper
+def retry_delay(module, attempt):
+    """Get sleep time for attempt: exponential backoff, capped, with jitter"""
+    delay = module.params["interval"] * (module.params["backoff"] ** attempt)
+    if module.params["max_interval"]:
+        delay = min(delay, module.params["max_interval"])
+    if module.params["jitter"]:
+        delay += random.uniform(0, delay * module.params["jitter"])
+    return delay
+
+
 @functionwrapper
 def parse_commands(module, _warnings):
     """Parse commands"""
@@ -74,6 +205,18 @@ def main():
         "match": {"default": "all", "choices": ["all", "any"]},
         "retries": {"default": 10, "type": "int"},
         "interval": {"default": 1, "type": "int"},
+        "backoff": {"default": 1.0, "type": "float"},
+        "max_interval": {"default": 0, "type": "int"},
+        "jitter": {"default": 0.0, "type": "float"},
+        "deadline": {"default": 0, "type": "int"},
+        "output": {
+            "default": "full",
+            "choices": ["full", "stdout", "json", "summary", "file"],
+        },
+        "max_bytes": {"default": 0, "type": "int"},
+        "output_dir": {"type": "path"},
+        "cache_ttl": {"default": 0, "type": "int"},
+        "device_filter": {"default": False, "type": "bool"},
     }
 
     argument_spec.update(junos_argument_spec)
@@ -90,21 +233,59 @@ def main():
 
     warnings = []
     check_args(module, warnings)
+    start_metrics(module, "junos_command")
     commands = parse_commands(module, warnings)
     result["warnings"] = warnings
 
     wait_for = module.params["wait_for"] or []
     conditionals = [Conditional(c) for c in wait_for]
+    probes = {}
+    if module.params["device_filter"]:
+        for item in conditionals:
+            probe = to_probe(commands, item)
+            if probe:
+                probes[item.raw] = probe
 
     retries = module.params["retries"]
-    interval = module.params["interval"]
     match = module.params["match"]
-    responses = None
-    while retries > 0:
-        responses = run_commands(module, commands)
+    deadline = module.params["deadline"]
+    deadline = time.time() + deadline if deadline else 0
+    responses = [None] * len(commands)
+    fileMode = module.params["output"] == "file"
+    indexes = list(range(len(commands)))
+    if probes or fileMode:
+        # File mode runs commands only as needed by conditionals
+        indexes = needed_commands(commands, [c for c in conditionals if c.raw not in probes])
+    attempts = []
+    attempt = 0
+    while retries > 0 and (indexes or conditionals):
+        start_time = time.perf_counter()
+        probeCmds = sorted({probes[c.raw] for c in conditionals if c.raw in probes})
+        # Only first attempt may be answered from cache, retries poll device
+        output = run_commands(
+            module,
+            [commands[idx] for idx in indexes] + probeCmds,
+            cache_ttl=0 if attempt else module.params["cache_ttl"],
+        )
+        for idx, response in zip(indexes, output):
+            responses[idx] = response
+        probeOutput = dict(zip(probeCmds, output[len(indexes):]))
+        attempts.append(
+            {
+                "attempt": attempt,
+                "commands": indexes,
+                "elapsed": round(time.perf_counter() - start_time, 4),
+            }
+        )
+        if probeCmds:
+            attempts[-1]["probes"] = probeCmds
 
-        for item in conditionals:
-            if item(responses):
+        for item in list(conditionals):
+            data = responses
+            if item.raw in probes:
+                data = list(responses)
+                data[conditional_index(item)] = probeOutput[probes[item.raw]]
+            if item(data):
                 if match == "any":
                     conditionals = []
                     break
@@ -113,21 +294,44 @@ def main():
         if not conditionals:
             break
 
-        time.sleep(interval)
         retries -= 1
+        if retries <= 0:
+            break
+        delay = retry_delay(module, attempt)
+        if deadline and time.time() + delay > deadline:
+            break
+        time.sleep(delay)
+        attempt += 1
+        # Re-run only commands referenced by unsatisfied (not probed) conditionals
+        indexes = needed_commands(commands, [c for c in conditionals if c.raw not in probes])
+
+    if not conditionals and None in responses and not fileMode:
+        # Conditionals satisfied by probes, fetch full output once
+        indexes = [idx for idx, response in enumerate(responses) if response is None]
+        for idx, response in zip(indexes, run_commands(module, [commands[idx] for idx in indexes])):
+            responses[idx] = response
 
+    if get_metrics(module):
+        get_metrics(module).inc("command_retries", max(len(attempts) - 1, 0))
     if conditionals:
         failed_conditions = [item.raw for item in conditionals]
         msg = "One or more conditional statements have not been satisfied"
-        module.fail_json(msg=msg, failed_conditions=failed_conditions)
+        module.fail_json(
+            msg=msg, failed_conditions=failed_conditions, attempts=attempts
+        )
 
     result.update(
         {
             "changed": False,
-            "stdout": responses,
-            "stdout_lines": list(toLines(responses)),
+            "attempts": attempts,
         }
     )
+    result.update(format_output(module, commands, responses))
+    if get_latency_outliers(module):
+        result["latency_outliers"] = get_latency_outliers(module)
+    if get_admission_waits(module):
+        result["admission_waits"] = get_admission_waits(module)
+    write_metrics(module)
 
     module.exit_json(**result)
 
@@ -16,11 +16,17 @@ ANSIBLE_METADATA = {
 DOCUMENTATION = ""
 EXAMPLES = ""
 RETURN = ""
+import time
+
 from ansible.module_utils.basic import AnsibleModule
 from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.config import (
     NetworkConfig, dumps)
+from ansible_collections.sense.junos.plugins.module_utils.backupstore import \
+    BackupStore
 from ansible_collections.sense.junos.plugins.module_utils.network.junos import (
-    check_args, get_config, junos_argument_spec, load_config, run_commands)
+    check_args, commit_status, get_admission_waits, get_config, get_device_diff,
+    get_device_host, get_last_commit, get_latency_outliers, junos_argument_spec,
+    load_config, run_commands, start_metrics, write_metrics)
 from ansible_collections.sense.junos.plugins.module_utils.runwrapper import \
     functionwrapper
 
@@ -51,6 +57,25 @@ def get_running_config(module):
     return contents
 
 
+@functionwrapper
+def store_backup(module):
+    """Store running config in deduplicated backup store. Config is not
+    fetched if there was no commit since the latest backup"""
+    rootdir = (module.params["backup_options"] or {}).get("dir_path")
+    store = BackupStore(get_device_host(module), rootdir)
+    marker = get_last_commit(module)
+    if store.isCurrent(marker):
+        return {"id": store.getLatest()["id"], "skipped": True}
+    manifest = store.add(get_config(module), marker)
+    return {
+        "id": manifest["id"],
+        "skipped": False,
+        "chunks": len(manifest["chunks"]),
+        "new_chunks": manifest["new_chunks"],
+        "new_bytes": manifest["new_bytes"],
+    }
+
+
 @functionwrapper
 def main():
     backup_spec = dict(filename=dict(), dir_path=dict(type="path"))
@@ -67,6 +92,13 @@ def main():
         config=dict(),
         backup=dict(type="bool", default=False),
         backup_options=dict(type="dict", options=backup_spec),
+        backup_mode=dict(default="full", choices=["full", "store"]),
+        commit_async=dict(type="bool", default=False),
+        confirm=dict(type="int", default=0),
+        commit_handle=dict(type="dict"),
+        confirm_commit=dict(type="bool", default=False),
+        commit_wait=dict(type="int", default=0),
+        diff_mode=dict(default="local", choices=["local", "device"]),
     )
 
     argument_spec.update(junos_argument_spec)
@@ -85,23 +117,64 @@ def main():
 
     warnings = list()
     check_args(module, warnings)
+    start_metrics(module, "junos_config")
 
     result = dict(changed=False, saved=False, warnings=warnings)
 
+    if module.params["commit_handle"]:
+        # Companion call of commit_async: poll (and confirm) started commit
+        if not module.check_mode:
+            result["commit"] = commit_status(
+                module,
+                module.params["commit_handle"],
+                module.params["confirm_commit"],
+                module.params["commit_wait"],
+            )
+            result["changed"] = result["commit"]["confirmed"]
+        write_metrics(module)
+        module.exit_json(**result)
+
     candidate = get_candidate(module)
 
-    if module.params["backup"]:
-        if not module.check_mode:
+    if module.params["backup"] and not module.check_mode:
+        if module.params["backup_mode"] == "store":
+            result["backup"] = store_backup(module)
+        else:
             result["__backup__"] = get_config(module)
     commands = list()
 
+    if (
+        any((module.params["lines"], module.params["src"]))
+        and module.check_mode
+        and module.params["diff_mode"] == "device"
+    ):
+        # Let the device compute the diff (show | compare) instead of
+        # downloading and diffing the full running config locally.
+        commands = dumps(candidate.items, "commands").split("\n")
+        commands[:0] = module.params["before"] or []
+        commands.extend(module.params["after"] or [])
+        start_time = time.perf_counter()
+        diff = get_device_diff(module, commands)
+        result["diff_time"] = round(time.perf_counter() - start_time, 4)
+        result["diff_mode"] = "device"
+        if diff:
+            result["changed"] = True
+            result["commands"] = commands
+            result["updates"] = commands
+            result["diff"] = {"prepared": diff}
+        write_metrics(module)
+        module.exit_json(**result)
+
     if any((module.params["lines"], module.params["src"])):
+        start_time = time.perf_counter()
         if match != "none":
             config = get_running_config(module)
             config = NetworkConfig(contents=config, indent=1)
             configobjs = candidate.difference(config, match=match, replace=replace)
         else:
             configobjs = candidate.items
+        result["diff_time"] = round(time.perf_counter() - start_time, 4)
+        result["diff_mode"] = "local"
 
         if configobjs:
             commands = dumps(configobjs, "commands")
@@ -126,7 +199,14 @@ def main():
                 commands.extend(module.params["after"])
 
             if not module.check_mode and module.params["update"] == "merge":
-                load_config(module, commands)
+                handle = load_config(
+                    module,
+                    commands,
+                    commit_async=module.params["commit_async"],
+                    confirm=module.params["confirm"],
+                )
+                if handle:
+                    result["commit_handle"] = handle
 
             result["changed"] = True
             result["commands"] = commands
@@ -143,6 +223,11 @@ def main():
                 "non-volatile storage"
             )
 
+    if get_latency_outliers(module):
+        result["latency_outliers"] = get_latency_outliers(module)
+    if get_admission_waits(module):
+        result["admission_waits"] = get_admission_waits(module)
+    write_metrics(module)
     module.exit_json(**result)
 
 
@@ -4,6 +4,8 @@ import os
 import json
 import tempfile
 import re
+import time
+from fnmatch import fnmatch
 # Copyright: Contributors to the Ansible project
 # GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
 import traceback
@@ -13,9 +15,17 @@ from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.six import iteritems
 from ansible.utils.display import Display
 from ansible_collections.sense.junos.plugins.module_utils.network.junos import (
-    IgnoreInterface, check_args, junos_argument_spec, run_commands)
+    IgnoreInterface, MacIndex, check_args, decode_ranges, encode_ranges,
+    get_admission_waits, get_device_host, get_latency_outliers,
+    get_switching_commands, junos_argument_spec, normalize_command,
+    parse_device_info, run_commands, set_command_format, start_metrics, to_json,
+    write_metrics, xml_to_json)
+from ansible_collections.sense.junos.plugins.module_utils.events import \
+    EventState
 from ansible_collections.sense.junos.plugins.module_utils.runwrapper import (
     classwrapper, functionwrapper)
+from ansible_collections.sense.junos.plugins.module_utils.statestore import \
+    StateStore
 
 display = Display()
 
@@ -50,18 +60,96 @@ class FactsBase:
 
     COMMANDS = []
 
+    # Parsers for wire formats. Both give the same (json) structure.
+    FORMAT_PARSERS = {"json": to_json, "xml": xml_to_json}
+
     def __init__(self, module):
         self.module = module
         self.facts = {}
         self.responses = None
+        self.macindex = MacIndex()
+        self.benchmark = {}
+        self._formatStore = None
 
     def populate(self):
         """Populate responses"""
-        self.responses = run_commands(self.module, self.COMMANDS, check_rc=False)
+        self.responses = self.run(self.COMMANDS)
 
     def run(self, cmd):
-        """Run commands"""
-        return run_commands(self.module, cmd, check_rc=False)
+        """Run commands. Commands ending with `| display json` are run in
+        wire format selected by wire_format param (or benchmarked)"""
+        commands = cmd if isinstance(cmd, list) else [cmd]
+        fmts = [self.get_format(command) for command in commands]
+        if self.module.params["wire_format"] == "benchmark":
+            return [
+                self.benchmark_command(command) if fmt else self._run([command])[0]
+                for command, fmt in zip(commands, fmts)
+            ]
+        responses = self._run(
+            [
+                set_command_format(command, fmt) if fmt else command
+                for command, fmt in zip(commands, fmts)
+            ]
+        )
+        return [
+            xml_to_json(out) if fmt == "xml" else out
+            for out, fmt in zip(responses, fmts)
+        ]
+
+    def _run(self, commands, raw=False, cache_ttl=None):
+        """Run commands on device (cache_ttl defaults to module param)"""
+        return run_commands(
+            self.module,
+            commands,
+            check_rc=False,
+            cache_ttl=self.module.params["cache_ttl"] if cache_ttl is None else cache_ttl,
+            raw=raw,
+        )
+
+    def get_format_store(self):
+        """Get per host store of selected wire formats"""
+        if not self._formatStore:
+            self._formatStore = StateStore(get_device_host(self.module), "wire_format")
+        return self._formatStore
+
+    def get_format(self, command):
+        """Get wire format for command (None if command format is fixed)"""
+        if not command.endswith("| display json"):
+            return None
+        wireFormat = self.module.params["wire_format"]
+        if wireFormat == "auto":
+            key = normalize_command(set_command_format(command, "json"))
+            return self.get_format_store().get(key, default={}).get("format", "json")
+        if wireFormat == "benchmark":
+            return "json"
+        return wireFormat
+
+    def benchmark_command(self, command):
+        """Run command in all wire formats, record bytes and time, store cheapest"""
+        key = normalize_command(command)
+        record = {}
+        result = None
+        for fmt, parser in self.FORMAT_PARSERS.items():
+            startTime = time.perf_counter()
+            # Never from result cache, cached replies would skew exec_time
+            out = self._run([set_command_format(command, fmt)], raw=True, cache_ttl=0)[0]
+            execTime = time.perf_counter() - startTime
+            startTime = time.perf_counter()
+            parsed = parser(out)
+            record[fmt] = {
+                "bytes": len(out.encode("utf-8")),
+                "exec_time": round(execTime, 4),
+                "parse_time": round(time.perf_counter() - startTime, 4),
+            }
+            if fmt == "json":
+                result = parsed
+        record["format"] = min(
+            self.FORMAT_PARSERS,
+            key=lambda fmt: record[fmt]["exec_time"] + record[fmt]["parse_time"],
+        )
+        self.get_format_store().set(key, record)
+        self.benchmark[key] = record
+        return result
 
 
 @classwrapper
@@ -75,23 +163,55 @@ class Default(FactsBase):
     # Takes ~12 seconds # TODO
 
     def populate(self):
+        style, commands = get_switching_commands(self.module)
+        self.COMMANDS = [self.COMMANDS[0], commands["mactable"]]
         super(Default, self).populate()
         self.facts["default"] = self.responses[0]
-        self.facts["mactable"] = self.parse_mac_table(self.responses[1])
+        mactable = self.responses[1] if isinstance(self.responses[1], dict) else {}
+        # Output decides the parser, style (model/version) may be wrong
+        if "ethernet-switching-table-information" in mactable:
+            style = "legacy"
+        elif "l2ng-l2ald-rtb-macdb" in mactable:
+            style = "l2ng"
+        if style == "legacy":
+            self.facts["mactable"] = self.parse_legacy_mac_table(mactable)
+        else:
+            self.facts["mactable"] = self.parse_mac_table(mactable)
 
     def parse_mac_table(self, cmdoutput):
         """Parse Mac Table"""
-        out = {}
         for macdata in cmdoutput.get("l2ng-l2ald-rtb-macdb", [{"": ""}])[0].get(
             "l2ng-l2ald-mac-entry-vlan", []
         ):
             mac = macdata.get("l2ng-l2-mac-address", [{"": ""}])[0].get("data", "")
             vlanid = macdata.get("l2ng-l2-vlan-id", [{"": ""}])[0].get("data", "")
+            intf = macdata.get("l2ng-l2-mac-logical-interface", [{"": ""}])[0].get(
+                "data", ""
+            )
             if mac and vlanid:
-                out.setdefault(vlanid, [])
-                if mac not in out[vlanid]:
-                    out[vlanid].append(mac)
-        return out
+                self.macindex.add(mac, intf, vlanid, "switching")
+        return self._getMacTable()
+
+    def parse_legacy_mac_table(self, cmdoutput):
+        """Parse Mac Table (legacy, non ELS switching)"""
+        for table in cmdoutput.get("ethernet-switching-table-information", [{"": ""}])[
+            0
+        ].get("ethernet-switching-table", []):
+            for macdata in table.get("mac-table-entry", []):
+                mac = macdata.get("mac-address", [{"": ""}])[0].get("data", "")
+                vlanid = macdata.get("mac-vlan-tag", [{"": ""}])[0].get("data", "")
+                intf = (
+                    macdata.get("mac-interfaces-list", [{"": ""}])[0]
+                    .get("mac-interfaces", [{"": ""}])[0]
+                    .get("data", "")
+                )
+                if mac and vlanid:
+                    self.macindex.add(mac, intf, vlanid, "switching")
+        return self._getMacTable()
+
+    def _getMacTable(self):
+        """Get vlan -> macs table from mac index"""
+        return {vlan: self.macindex.getVlanMacs(vlan) for vlan in self.macindex.vlans}
 
 
 @classwrapper
@@ -105,14 +225,88 @@ class Interfaces(FactsBase):
         "show interfaces ae* | display json",
     ]
 
+    # Vlan output keys for ELS (l2ng) and legacy switching
+    VLAN_KEYS = {
+        "l2ng": {
+            "root": "l2ng-l2ald-vlan-instance-information",
+            "vlan": "l2ng-l2ald-vlan-instance-group",
+            "tag": "l2ng-l2rtb-vlan-tag",
+            "member": "l2ng-l2rtb-vlan-member",
+            "interface": "l2ng-l2rtb-vlan-member-interface",
+            "tagness": "l2ng-l2rtb-vlan-member-tagness",
+        },
+        "legacy": {
+            "root": "vlan-information",
+            "vlan": "vlan",
+            "tag": "vlan-tag",
+            "memberlist": "vlan-member-list",
+            "member": "vlan-member",
+            "interface": "vlan-member-interface",
+            "tagness": "vlan-member-tagness",
+        },
+    }
+
+    def __init__(self, module):
+        super(Interfaces, self).__init__(module)
+        self.switching = "l2ng"
+        # Scope override (used for event driven partial re-collection)
+        self.scope = None
+        # Interface patterns (fnmatch, as accepted by show interfaces) and vlan ids
+        # in scope. Empty means everything is collected.
+        self.intfScope = []
+        self.vlanScope = set()
+
     def populate(self):
+        self.switching, commands = get_switching_commands(self.module)
+        scope = self.scope or self.module.params.get("gather_scope") or {}
+        self.intfScope = scope.get("interfaces") or []
+        try:
+            self.vlanScope = decode_ranges(scope["vlans"]) if scope.get("vlans") else set()
+        except ValueError:
+            self.module.fail_json(
+                msg=f"Bad gather_scope.vlans range '{scope['vlans']}', "
+                "expected vlan ids and ranges, e.g. 100-102,300"
+            )
+        # Scoped show interfaces also return ae* in scope, so ae* is only
+        # needed when collecting everything
+        intfCommands = [
+            f"show interfaces {intf} | display json" for intf in self.intfScope
+        ] or [self.COMMANDS[0], self.COMMANDS[3]]
+        self.COMMANDS = [commands["vlans"], self.COMMANDS[2]] + intfCommands
         super(Interfaces, self).populate()
         self.facts.setdefault("info", {"macs": []})
         self.facts.setdefault("interfaces", {})
-        self.parse_interfaces(self.responses[0])
-        self.parse_vlans(self.responses[1])
-        self.parse_lldp(self.responses[2])
-        self.parse_port_channels(self.responses[3])
+        for cmdoutput in self.responses[2:]:
+            if isinstance(cmdoutput, dict):
+                self.parse_interfaces(cmdoutput)
+        self.parse_lldp(self.responses[1])
+        for cmdoutput in self.responses[2:]:
+            if isinstance(cmdoutput, dict):
+                self.parse_port_channels(cmdoutput)
+        self.merge_lldp_lags()
+        # Vlans last, effective MTU is computed from all member interfaces
+        self.parse_vlans(self.responses[0])
+        self.facts["info"]["macs"] = self.macindex.getMacs("interface")
+        self.save_interfaces()
+
+    def save_interfaces(self):
+        """Save slow changing interface attributes for interfaces_status subset"""
+        store = StateStore(get_device_host(self.module), "interfaces")
+        cached = store.get("interfaces", default={})
+        for intf, intfData in self.facts["interfaces"].items():
+            cached[intf] = {
+                key: val
+                for key, val in intfData.items()
+                if key not in InterfacesStatus.STATUS_KEYS
+            }
+        store.set("interfaces", cached)
+
+    def inScope(self, intf):
+        """Check if interface is in gather scope"""
+        if not self.intfScope:
+            return True
+        intf = intf.split(".")[0]
+        return any(fnmatch(intf, pattern) for pattern in self.intfScope)
 
     def parse_interfaces(self, cmdoutput):
         """Parse Junos Output Interfaces"""
@@ -120,7 +314,7 @@ class Interfaces(FactsBase):
             "physical-interface", []
         ):
             intf = physdata.get("name", [{"": ""}])[0].get("data", "")
-            if intf:
+            if intf and self.inScope(intf):
                 try:
                     newEntry = self.facts["interfaces"].setdefault(intf, {})
                     self._getOperStatus(newEntry, physdata)
@@ -132,10 +326,9 @@ class Interfaces(FactsBase):
                 except IgnoreInterface:
                     del self.facts["interfaces"][intf]
 
-    def _addMac(self, macaddr):
+    def _addMac(self, macaddr, intf=""):
         """Add Mac Address"""
-        if macaddr not in self.facts["info"]["macs"]:
-            self.facts["info"]["macs"].append(macaddr)
+        self.macindex.add(macaddr, intf, "", "interface")
 
     def _getSwitchport(self, newEntry, physdata):
         """Get Switchport"""
@@ -192,7 +385,7 @@ class Interfaces(FactsBase):
         for key in ["current-physical-address", "hardware-physical-address"]:
             mac = physdata.get(key, [{"": ""}])[0].get("data", "")
             if mac:
-                self._addMac(mac)
+                self._addMac(mac, physdata.get("name", [{"": ""}])[0].get("data", ""))
                 newEntry["mac"] = mac
 
     def _getLagMembers(self, newEntry, physdata):
@@ -212,7 +405,7 @@ class Interfaces(FactsBase):
             "physical-interface", []
         ):
             intf = physdata.get("name", [{"": ""}])[0].get("data", "")
-            if intf.startswith("ae"):
+            if intf.startswith("ae") and self.inScope(intf):
                 try:
                     newEntry = self.facts["interfaces"].setdefault(intf, {})
                     self._getOperStatus(newEntry, physdata)
@@ -226,48 +419,262 @@ class Interfaces(FactsBase):
 
     def parse_taggness(self, inputval):
         """Parse if it is tagged or not"""
-        taginft = inputval.get("l2ng-l2rtb-vlan-member-interface", [{"": ""}])[0].get(
-            "data", ""
-        )
+        keys = self.VLAN_KEYS[self.switching]
+        taginft = inputval.get(keys["interface"], [{"": ""}])[0].get("data", "")
+        if not isinstance(taginft, str):
+            # Empty vlans have member interface data: [null]
+            return "", ""
         taginft = taginft.replace("*", "").split(".")[0]
-        tagtype = inputval.get("l2ng-l2rtb-vlan-member-tagness", [{"": ""}])[0].get(
-            "data", ""
-        )
+        tagtype = inputval.get(keys["tagness"], [{"": ""}])[0].get("data", "")
         return tagtype, taginft
 
+    def _getVlanMTU(self, members, interfaces=None):
+        """Get effective vlan MTU (lowest MTU of member interfaces)"""
+        interfaces = self.facts["interfaces"] if interfaces is None else interfaces
+        mtus = []
+        for intf in members:
+            try:
+                mtus.append(int(interfaces.get(intf, {}).get("mtu", 0)))
+            except (TypeError, ValueError):
+                continue
+        mtus = [mtu for mtu in mtus if mtu]
+        return min(mtus) if mtus else 1500
+
+    def _getVlanMembers(self, vlan):
+        """Get vlan members (legacy output has them inside member list)"""
+        keys = self.VLAN_KEYS[self.switching]
+        if "memberlist" in keys:
+            return vlan.get(keys["memberlist"], [{}])[0].get(keys["member"], [])
+        return vlan.get(keys["member"], [])
+
     def parse_vlans(self, cmdoutput):
-        """Parse Vlans"""
-        for vlan in cmdoutput.get("l2ng-l2ald-vlan-instance-information", [{"": ""}])[
-            0
-        ].get("l2ng-l2ald-vlan-instance-group", []):
-            vlanid = vlan.get("l2ng-l2rtb-vlan-tag", [{"": ""}])[0].get("data", "")
-            if vlanid:
-                newEntry = self.facts["interfaces"].setdefault(f"Vlan{vlanid}", {})
-                newEntry["mtu"] = (
-                    1500  # Need a way to loop all interfaces self.facts["interfaces"][intf].get("mtu", 1500)
-                )
-                # Get tagged vlan members l2ng-l2rtb-vlan-member
-                for vlanmember in vlan.get("l2ng-l2rtb-vlan-member", []):
-                    tagtype, taginft = self.parse_taggness(vlanmember)
-                    newEntry.setdefault(tagtype, [])
-                    if taginft not in newEntry[tagtype]:
-                        newEntry[tagtype].append(taginft)
+        """Parse Vlans (one pass) and build reverse port -> vlan ranges index"""
+        for style, styleKeys in self.VLAN_KEYS.items():
+            # Output decides the keys, style (model/version) may be wrong
+            if styleKeys["root"] in cmdoutput:
+                self.switching = style
+        keys = self.VLAN_KEYS[self.switching]
+        portVlans = {}
+        for vlan in cmdoutput.get(keys["root"], [{"": ""}])[0].get(keys["vlan"], []):
+            vlanid = vlan.get(keys["tag"], [{"": ""}])[0].get("data", "")
+            # Untagged/internal vlans have no numeric tag ("NA"), skipped
+            if not str(vlanid).isdigit() or (self.vlanScope and int(vlanid) not in self.vlanScope):
+                continue
+            members = {}
+            for vlanmember in self._getVlanMembers(vlan):
+                tagtype, taginft = self.parse_taggness(vlanmember)
+                if taginft and self.inScope(taginft):
+                    members.setdefault(tagtype, set()).add(taginft)
+                    portVlans.setdefault(taginft, {}).setdefault(tagtype, set()).add(
+                        int(vlanid)
+                    )
+            newEntry = self.facts["interfaces"].setdefault(f"Vlan{vlanid}", {})
+            for tagtype, intfs in members.items():
+                newEntry[tagtype] = sorted(intfs)
+            newEntry["mtu"] = self._getVlanMTU(set().union(*members.values()))
+        self.facts["port_vlans"] = {
+            intf: {tagtype: encode_ranges(vlans) for tagtype, vlans in tags.items()}
+            for intf, tags in portVlans.items()
+        }
 
     def parse_lldp(self, cmdoutput):
-        """Parse LLDP"""
-        for lldpdata in cmdoutput["lldp-neighbors-information"]:
+        """Parse LLDP into compact index: local port -> remote system/chassis/port
+        and reverse index: remote chassis id -> local ports"""
+        self.facts.setdefault("lldp", {})
+        self.facts.setdefault("lldp_chassis", {})
+        for lldpdata in cmdoutput.get("lldp-neighbors-information", [{"": ""}])[
+            0
+        ].get("lldp-neighbor-information", []):
             intf = lldpdata.get("lldp-local-port-id", [{"": ""}])[0].get("data", "")
-            if intf:
+            if intf and self.inScope(intf):
                 entryOut = {"local_port_id": intf}
                 for key, mapping in {
                     "lldp-remote-system-name": "remote_system_name",
                     "lldp-remote-chassis-id": "remote_chassis_id",
                     "lldp-remote-port-id": "remote_port_id",
+                    "lldp-remote-port-description": "remote_port_description",
+                    "lldp-local-parent-interface-name": "lag",
                 }.items():
                     tmpVal = lldpdata.get(key, [{"": ""}])[0].get("data", "")
-                    if tmpVal:
+                    if tmpVal and tmpVal != "-":
                         entryOut[mapping] = tmpVal
-                self.facts["lldp"][intf] = lldpdata
+                self.facts["lldp"][intf] = entryOut
+                if "remote_chassis_id" in entryOut:
+                    self.facts["lldp_chassis"].setdefault(
+                        entryOut["remote_chassis_id"], []
+                    ).append(intf)
+
+    def merge_scoped(self, cachedFacts):
+        """Merge facts collected for scoped interfaces into cached full facts.
+        Vlan members and port_vlans are merged per interface, scoped run only
+        sees vlan members in scope"""
+        merged = cachedFacts
+        lldp = merged.setdefault("lldp", {})
+        for intf in [intf for intf in lldp if self.inScope(intf)]:
+            del lldp[intf]
+        lldp.update(self.facts.get("lldp", {}))
+        merged["lldp_chassis"] = {}
+        for intf, entry in lldp.items():
+            if "remote_chassis_id" in entry:
+                merged["lldp_chassis"].setdefault(entry["remote_chassis_id"], []).append(
+                    intf
+                )
+        interfaces = merged.setdefault("interfaces", {})
+        for intf, intfData in self.facts["interfaces"].items():
+            if not intf.startswith("Vlan"):
+                interfaces[intf] = intfData
+        for vlan, vlanData in self.facts["interfaces"].items():
+            if not vlan.startswith("Vlan"):
+                continue
+            entry = interfaces.setdefault(vlan, {})
+            members = set()
+            for tagtype in (set(entry) | set(vlanData)) - {"mtu"}:
+                intfs = {intf for intf in entry.get(tagtype, []) if not self.inScope(intf)}
+                intfs.update(vlanData.get(tagtype, []))
+                entry.pop(tagtype, None)
+                if intfs:
+                    entry[tagtype] = sorted(intfs)
+                    members.update(intfs)
+            entry["mtu"] = self._getVlanMTU(members, interfaces)
+        portVlans = {
+            intf: tags
+            for intf, tags in merged.get("port_vlans", {}).items()
+            if not self.inScope(intf)
+        }
+        portVlans.update(self.facts.get("port_vlans", {}))
+        merged["port_vlans"] = portVlans
+        return merged
+
+    def merge_lldp_lags(self):
+        """Add LAG (channel-member) information to LLDP index"""
+        for intf, intfData in self.facts["interfaces"].items():
+            for member in intfData.get("channel-member", []):
+                if member in self.facts["lldp"]:
+                    self.facts["lldp"][member]["lag"] = intf
+
+
+@classwrapper
+class InterfacesStatus(FactsBase):
+    """Interfaces oper/admin status only (show interfaces terse), merged with
+    attributes (mtu, speed, mac, ...) cached from the last full interfaces run"""
+
+    COMMANDS = ["show interfaces terse | display json"]
+
+    STATUS_KEYS = ("operstatus", "lineprotocol")
+
+    def populate(self):
+        super(InterfacesStatus, self).populate()
+        store = StateStore(get_device_host(self.module), "interfaces")
+        cached = store.get("interfaces", default={})
+        self.facts["interfaces"] = {
+            intf: dict(intfData) for intf, intfData in cached.items()
+        }
+        self.parse_status(self.responses[0], bool(cached))
+
+    def parse_status(self, cmdoutput, cachedOnly=False):
+        """Parse terse output. With cachedOnly, interfaces not known from full
+        run (ignored there, e.g. Unlimited MTU) are skipped"""
+        for physdata in cmdoutput.get("interface-information", [{"": ""}])[0].get(
+            "physical-interface", []
+        ):
+            intf = physdata.get("name", [{"": ""}])[0].get("data", "")
+            if not intf or (cachedOnly and intf not in self.facts["interfaces"]):
+                continue
+            newEntry = self.facts["interfaces"].setdefault(intf, {})
+            newEntry["operstatus"] = physdata.get("oper-status", [{"": ""}])[0].get(
+                "data", "unknown"
+            )
+            newEntry["lineprotocol"] = physdata.get("admin-status", [{"": ""}])[
+                0
+            ].get("data", "unknown")
+
+
+@classwrapper
+class Counters(FactsBase):
+    """Interface counters and rates computed from previous (cached) sample"""
+
+    COMMANDS = ["show interfaces statistics detail | display json"]
+
+    # counter name: (output list, key)
+    COUNTER_KEYS = {
+        "input_bytes": ("traffic-statistics", "input-bytes"),
+        "output_bytes": ("traffic-statistics", "output-bytes"),
+        "input_packets": ("traffic-statistics", "input-packets"),
+        "output_packets": ("traffic-statistics", "output-packets"),
+        "input_errors": ("input-error-list", "input-errors"),
+        "input_drops": ("input-error-list", "input-drops"),
+        "output_errors": ("output-error-list", "output-errors"),
+        "output_drops": ("output-error-list", "output-drops"),
+    }
+
+    def populate(self):
+        super(Counters, self).populate()
+        timestamp = time.time()
+        store = StateStore(get_device_host(self.module), "counters")
+        previous = store.get("sample", default={})
+        sample = self.parse_counters(self.responses[0])
+        self.facts["counters"] = {
+            intf: dict(zip(self.COUNTER_KEYS, values[0]))
+            for intf, values in sample.items()
+        }
+        self.facts["counter_rates"] = self.get_rates(previous, sample, timestamp)
+        store.set("sample", {"timestamp": timestamp, "interfaces": sample})
+
+    def parse_counters(self, cmdoutput):
+        """Parse counters to {intf: [[values in COUNTER_KEYS order], cleared]}"""
+        out = {}
+        for physdata in cmdoutput.get("interface-information", [{"": ""}])[0].get(
+            "physical-interface", []
+        ):
+            intf = physdata.get("name", [{"": ""}])[0].get("data", "")
+            if not intf:
+                continue
+            values = []
+            for listkey, key in self.COUNTER_KEYS.values():
+                value = (
+                    physdata.get(listkey, [{"": ""}])[0]
+                    .get(key, [{"": ""}])[0]
+                    .get("data", "")
+                )
+                try:
+                    values.append(int(value))
+                except (TypeError, ValueError):
+                    values.append(None)
+            cleared = physdata.get("statistics-cleared", [{"": ""}])[0].get("data", "")
+            out[intf] = [values, cleared]
+        return out
+
+    @staticmethod
+    def get_delta(prev, cur, cleared):
+        """Get counter delta, handling 32bit counter wraps and clears"""
+        if prev is None or cur is None or cleared:
+            return None
+        if cur >= prev:
+            return cur - prev
+        # Wrap only if previous value was close to 32/64bit max and current
+        # value is low, otherwise counters were cleared (or device rebooted)
+        for limit in (2**32, 2**64):
+            if limit - limit // 4 <= prev < limit and cur < limit // 4:
+                return cur + limit - prev
+        return None
+
+    def get_rates(self, previous, sample, timestamp):
+        """Get per second rates from previous sample"""
+        rates = {}
+        interval = timestamp - previous.get("timestamp", timestamp)
+        if interval <= 0:
+            return rates
+        for intf, (values, cleared) in sample.items():
+            if intf not in previous.get("interfaces", {}):
+                continue
+            prevValues, prevCleared = previous["interfaces"][intf]
+            rates[intf] = {"interval": round(interval, 3)}
+            for name, prev, cur in zip(self.COUNTER_KEYS, prevValues, values):
+                delta = self.get_delta(prev, cur, cleared != prevCleared)
+                rates[intf][f"{name}_rate"] = (
+                    None if delta is None else round(delta / interval, 3)
+                )
+        return rates
 
 
 @classwrapper
@@ -328,25 +735,188 @@ class Routing(FactsBase):
 FACT_SUBSETS = {
     "default": Default,
     "interfaces": Interfaces,
+    "interfaces_status": InterfacesStatus,
+    "counters": Counters,
     "routing": Routing,
 }
 
 VALID_SUBSETS = frozenset(FACT_SUBSETS.keys())
 
+# Subsets only collected when requested explicitly (not part of all)
+OPTIONAL_SUBSETS = frozenset(["interfaces_status", "counters"])
+
+# Subsets which can be reused from cache if no events marked them dirty.
+# Not default (mac table) nor routing (protocol routes): no syslog event
+# reports mac learning or route changes
+EVENT_SUBSETS = frozenset(["interfaces", "interfaces_status"])
+
+# Params which change collected subset facts (cached facts are kept per scope)
+FACT_SCOPE_PARAMS = ("gather_scope", "wire_format")
+
+
+# Version of compact fact profile schema (bump on incompatible changes)
+COMPACT_SCHEMA_VERSION = "compact/2"
+
+
+@functionwrapper
+def compact_facts(facts):
+    """Compact fact profile: replace raw device output with extracted,
+    typed fields and add schema version. Facts derivable from other facts
+    are dropped: mactable if macindex is present, info.macs (interface
+    MACs are in interfaces.<name>.mac)"""
+    out = {"schema_version": COMPACT_SCHEMA_VERSION}
+    for key, value in facts.items():
+        if key == "gather_subset":
+            value = sorted(value[0])
+        elif key == "default":
+            value = {
+                devkey.replace("network_os_", ""): devval
+                for devkey, devval in parse_device_info(value).items()
+                if devkey != "network_os"
+            }
+        elif key == "interfaces":
+            value = {intf: compact_interface(intfData) for intf, intfData in value.items()}
+        elif key == "mactable" and "macindex" in facts:
+            continue
+        elif key == "info":
+            value = {infokey: infoval for infokey, infoval in value.items() if infokey != "macs"}
+            if not value:
+                continue
+        out[key] = value
+    return out
+
+
+@functionwrapper
+def compact_interface(intfData):
+    """Cast interface values (Junos returns numbers as strings)"""
+    out = dict(intfData)
+    for key in ("mtu", "speed"):
+        try:
+            out[key] = int(out[key])
+        except (KeyError, TypeError, ValueError):
+            continue
+    return out
+
+
+@functionwrapper
+def get_fact_scope(module):
+    """Get cache scope of subset facts (params which change collected facts)"""
+    return json.dumps(
+        {param: module.params.get(param) for param in FACT_SCOPE_PARAMS}, sort_keys=True
+    )
+
+
+@functionwrapper
+def collect_subset(module, key, eventState):
+    """Collect subset facts. With eventState, cached facts (of the same scope)
+    are reused if no event marked the subset dirty, and only dirty interfaces
+    are re-collected if events reported single interfaces.
+    Returns (inst, facts, macindex, how)"""
+    inst = FACT_SUBSETS[key](module)
+    cached, dirty = None, {}
+    scope = get_fact_scope(module)
+    if eventState and key in EVENT_SUBSETS:
+        cached = eventState.getFacts(key, module.params["event_max_age"], scope)
+        dirty = eventState.getDirty(key)
+    subsetIndex = MacIndex()
+    how = "collected"
+    started = time.time()
+    if cached is not None and dirty and not dirty.get("all") and hasattr(inst, "merge_scoped"):
+        gatherScope = module.params.get("gather_scope") or {}
+        # Dirty interfaces out of gather scope are not collected
+        intfs = [
+            intf
+            for intf in dirty.get("interfaces", [])
+            if not gatherScope.get("interfaces")
+            or any(fnmatch(intf, pattern) for pattern in gatherScope["interfaces"])
+        ]
+        if not intfs:
+            eventState.setFacts(key, cached, started, scope)
+            dirty = {}
+        inst.scope = dict(gatherScope, interfaces=intfs)
+        how = "partial"
+    if cached is not None and not dirty:
+        subsetIndex.load(cached["macindex"])
+        return inst, cached["facts"], subsetIndex, "cached"
+    inst.populate()
+    subsetFacts = inst.facts
+    if how == "partial":
+        subsetFacts = inst.merge_scoped(cached["facts"])
+        subsetIndex.load(cached["macindex"])
+    subsetIndex.merge(inst.macindex)
+    if how == "partial" and "info" in subsetFacts:
+        subsetFacts["info"]["macs"] = subsetIndex.getMacs("interface")
+    if eventState and key in EVENT_SUBSETS:
+        eventState.setFacts(
+            key, {"facts": subsetFacts, "macindex": subsetIndex.serialize()}, started, scope
+        )
+    return inst, subsetFacts, subsetIndex, how
+
+
+@functionwrapper
+def gather_facts(module, runable_subsets):
+    """Collect facts of subsets (in fact_profile format)"""
+    facts = {"gather_subset": [runable_subsets]}
+
+    eventState = None
+    if module.params["event_driven"]:
+        eventState = EventState(get_device_host(module))
+        facts["events"] = {}
+
+    macindex = MacIndex()
+    for key in runable_subsets:
+        try:
+            inst, subsetFacts, subsetIndex, how = collect_subset(module, key, eventState)
+            facts.update(subsetFacts)
+            macindex.merge(subsetIndex)
+            if eventState:
+                facts["events"][key] = how
+            if inst.benchmark:
+                facts.setdefault("wire_format_benchmark", {}).update(inst.benchmark)
+        except Exception as ex:
+            display.vvv(traceback.format_exc())
+            write_metrics(module, failed=True)
+            raise Exception(traceback.format_exc()) from ex
+    if module.params["mac_index"]:
+        # Opt-in: mac -> (interface, vlan, source) overlaps mactable and info.macs
+        facts["macindex"] = macindex.serialize()
+    if module.params["fact_profile"] == "compact":
+        facts = compact_facts(facts)
+    return facts
+
 
 @functionwrapper
 def main():
     """main entry point for module execution"""
-    argument_spec = {"gather_subset": {"default": ["!default"], "type": "list"}}
+    argument_spec = {
+        "gather_subset": {"default": ["!default"], "type": "list"},
+        "cache_ttl": {"default": 0, "type": "int"},
+        "fact_profile": {"default": "full", "choices": ["full", "compact"]},
+        "mac_index": {"default": False, "type": "bool"},
+        "event_driven": {"default": False, "type": "bool"},
+        "event_max_age": {"default": 3600, "type": "int"},
+        "wire_format": {
+            "default": "json",
+            "choices": ["json", "xml", "auto", "benchmark"],
+        },
+        "gather_scope": {
+            "type": "dict",
+            "options": {
+                "interfaces": {"type": "list", "elements": "str"},
+                "vlans": {"type": "str"},
+            },
+        },
+    }
     argument_spec.update(junos_argument_spec)
     module = AnsibleModule(argument_spec=argument_spec, supports_check_mode=True)
+    start_metrics(module, "junos_facts")
     gather_subset = module.params["gather_subset"]
     runable_subsets = set()
     exclude_subsets = set()
 
     for subset in gather_subset:
         if subset == "all":
-            runable_subsets.update(VALID_SUBSETS)
+            runable_subsets.update(VALID_SUBSETS - OPTIONAL_SUBSETS)
             continue
         if subset.startswith("!"):
             subset = subset[1:]
@@ -363,25 +933,15 @@ def main():
         else:
             runable_subsets.add(subset)
     if not runable_subsets:
-        runable_subsets.update(VALID_SUBSETS)
+        runable_subsets.update(VALID_SUBSETS - OPTIONAL_SUBSETS)
 
     runable_subsets.difference_update(exclude_subsets)
     runable_subsets.add("default")
+    if "interfaces" in runable_subsets:
+        # Full interfaces run already includes status
+        runable_subsets.discard("interfaces_status")
 
-    facts = {"gather_subset": [runable_subsets]}
-
-    instances = []
-    for key in runable_subsets:
-        instances.append(FACT_SUBSETS[key](module))
-
-    for inst in instances:
-        if inst:
-            try:
-                inst.populate()
-                facts.update(inst.facts)
-            except Exception as ex:
-                display.vvv(traceback.format_exc())
-                raise Exception(traceback.format_exc()) from ex
+    facts = gather_facts(module, runable_subsets)
 
     ansible_facts = {}
     for key, value in iteritems(facts):
@@ -390,12 +950,20 @@ def main():
 
     warnings = []
     check_args(module, warnings)
+    if get_latency_outliers(module):
+        warnings.append(f"Slow commands (latency outliers): {get_latency_outliers(module)}")
+    extra = {}
+    if get_admission_waits(module):
+        extra["admission_waits"] = get_admission_waits(module)
+    write_metrics(module)
     if len(str(ansible_facts)) > 100000:
         facts_path = dumpFactsToTmp(ansible_facts)
         display.vvv(facts_path)
-        module.exit_json(ansible_facts_file={"file": facts_path}, warnings=warnings)
+        module.exit_json(
+            ansible_facts_file={"file": facts_path}, warnings=warnings, **extra
+        )
     else:
-        module.exit_json(ansible_facts=ansible_facts, warnings=warnings)
+        module.exit_json(ansible_facts=ansible_facts, warnings=warnings, **extra)
 
 
 if __name__ == "__main__":
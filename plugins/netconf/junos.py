@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# GNU General Public License v3.0+ (see COPYING or https://www.gnu.org/licenses/gpl-3.0.txt)
+import hashlib
+import json
+
+from ansible.module_utils._text import to_bytes, to_text
+from ansible_collections.ansible.netcommon.plugins.plugin_utils.netconf_base import (
+    NetconfBase, ensure_ncclient)
+from ansible_collections.sense.junos.plugins.module_utils.network.junos import (
+    parse_device_info, xml_to_json)
+from ansible_collections.sense.junos.plugins.module_utils.runwrapper import \
+    classwrapper
+
+
+@classwrapper
+class Netconf(NetconfBase):
+    """Junos netconf plugin (prompt free, framed rpc transport)"""
+
+    def __init__(self, *args, **kwargs):
+        super(Netconf, self).__init__(*args, **kwargs)
+        self._device_info = None
+
+    @ensure_ncclient
+    def get_device_info(self):
+        """Get Device Info (get-software-information rpc)"""
+        if not self._device_info:
+            reply = self.execute_rpc("<get-software-information/>")
+            self._device_info = parse_device_info(xml_to_json(reply))
+        return self._device_info
+
+    @ensure_ncclient
+    def execute_rpc(self, rpc):
+        """Execute rpc (xml string) and return reply as xml string"""
+        return to_text(self.dispatch(rpc_command=rpc), errors="surrogate_or_strict")
+
+    @ensure_ncclient
+    def execute_rpc_to_file(self, rpc, path):
+        """Execute rpc and write raw reply to path (reply is not returned)"""
+        data = to_bytes(self.execute_rpc(rpc), errors="surrogate_or_strict")
+        with open(path, "wb") as fobj:
+            fobj.write(data)
+        return {"path": path, "bytes": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+    def get_capabilities(self):
+        """Get capabilities"""
+        result = {
+            "rpc": self.get_base_rpc() + ["execute_rpc", "execute_rpc_to_file"],
+            "network_api": "netconf",
+            "device_info": self.get_device_info(),
+            "server_capabilities": list(self.m.server_capabilities),
+            "client_capabilities": list(self.m.client_capabilities),
+            "session_id": self.m.session_id,
+        }
+        return json.dumps(result)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""Shared helpers for junos unit tests (fixtures are `| display json` outputs)."""
+import json
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+from ansible.module_utils.common.parameters import DEFAULT_TYPE_VALIDATORS
+from ansible.module_utils.connection import ConnectionError
+
+from ansible_collections.sense.junos.plugins.module_utils.network import junos
+from ansible_collections.sense.junos.plugins.module_utils.network.junos import \
+    junos_argument_spec
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def load_fixture(name):
+    """Load fixture (parsed json)"""
+    with open(os.path.join(FIXTURE_PATH, name), encoding="utf-8") as fd:
+        return json.load(fd)
+
+
+class FailJson(Exception):
+    """Raised by FakeModule.fail_json"""
+
+
+class FakeModule:
+    """Minimal AnsibleModule stand-in for module_utils functions"""
+
+    def __init__(self, params=None, check_mode=False):
+        self.params = {key: spec.get("default") for key, spec in junos_argument_spec.items()}
+        self.params.update(params or {})
+        self.check_mode = check_mode
+        self.warnings = []
+        self._socket_path = None
+        # Used by ComplexList (to_commands)
+        self._CHECK_ARGUMENT_TYPES_DISPATCHER = DEFAULT_TYPE_VALIDATORS
+
+    def fail_json(self, **kwargs):
+        raise FailJson(kwargs)
+
+    def warn(self, msg):
+        self.warnings.append(msg)
+
+    @staticmethod
+    def jsonify(data):
+        return json.dumps(data)
+
+
+@pytest.fixture
+def state_dir(tmp_path, monkeypatch):
+    """Per test state directory (SENSE_JUNOS_STATE_DIR)"""
+    monkeypatch.setenv("SENSE_JUNOS_STATE_DIR", str(tmp_path))
+    return tmp_path
+
+
+JUNOS_NS = "http://xml.juniper.net/junos/23.4R1/junos"
+NC_NS = "urn:ietf:params:xml:ns:netconf:base:1.0"
+
+
+def to_xml(tag, node):
+    """Build element from `| display json` node (inverse of xml_to_json)"""
+    elem = ET.Element(tag)
+    for key, val in node.get("attributes", {}).items():
+        if key.startswith("xmlns"):
+            continue
+        if key.startswith("junos:"):
+            key = f"{{{JUNOS_NS}}}{key[6:]}"
+        elem.set(key, val)
+    if "data" in node:
+        elem.text = node["data"] if isinstance(node["data"], str) else None
+        return elem
+    for key, children in node.items():
+        # xml comments are plain strings in json output
+        if key == "attributes" or not isinstance(children, list):
+            continue
+        for child in children:
+            elem.append(to_xml(key, child))
+    return elem
+
+
+def rpc_reply(*children, text=None):
+    """Build rpc-reply string"""
+    reply = ET.Element(f"{{{NC_NS}}}rpc-reply")
+    reply.text = text
+    for child in children:
+        reply.append(child)
+    return ET.tostring(reply, encoding="unicode")
+
+
+def without_xmlns(node):
+    """Drop xmlns attributes (namespace declarations are not attributes in xml)"""
+    if isinstance(node, list):
+        return [without_xmlns(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    out = {}
+    for key, val in node.items():
+        if key == "attributes":
+            val = {akey: aval for akey, aval in val.items() if not akey.startswith("xmlns")}
+            if not val:
+                continue
+        out[key] = without_xmlns(val)
+    return out
+
+
+class StandInNetconf:
+    """Local netconf server stand-in, answers rpcs like the Netconf plugin
+    (execute_rpc returns rpc-reply xml as string) and records them"""
+
+    def __init__(self, commands=None, config="", deviceInfo=None):
+        self.commands = commands or {}
+        self.config = config
+        self.deviceInfo = deviceInfo or {}
+        self.rpcs = []
+        self.candidate = None
+
+    @staticmethod
+    def get_option(name):
+        return {"host": "127.0.0.1", "persistent_command_timeout": 30}.get(name)
+
+    def get_device_info(self):
+        return self.deviceInfo
+
+    def get_pending_commit(self):
+        raise ConnectionError("method not found")
+
+    def execute_rpc(self, rpc):
+        self.rpcs.append(rpc)
+        elem = ET.fromstring(rpc)
+        if elem.tag == "command":
+            return self.command(elem.text, elem.get("format"))
+        if elem.tag == "get-configuration":
+            config = ET.Element("configuration-text")
+            config.text = self.config
+            return rpc_reply(config)
+        if elem.tag == "load-configuration":
+            self.candidate = elem.find("configuration-set").text
+            if "invalid" in self.candidate:
+                error = ET.Element("rpc-error")
+                ET.SubElement(error, "error-message").text = "syntax error"
+                return rpc_reply(error)
+        return rpc_reply(ET.Element("ok"))
+
+    def command(self, command, fmt):
+        """Reply to <command> rpc from `| display json` fixture"""
+        if command not in self.commands:
+            # Netconf plugin raises rpc-error replies as ConnectionError
+            raise ConnectionError(f"syntax error: {command}")
+        data = self.commands[command]
+        if fmt == "json":
+            return rpc_reply(text=json.dumps(data))
+        if fmt == "text":
+            output = ET.Element("output")
+            output.text = data if isinstance(data, str) else json.dumps(data)
+            return rpc_reply(output)
+        return rpc_reply(*[to_xml(key, node[0]) for key, node in data.items()])
+
+
+class StandInCli:
+    """network_cli connection stand-in (cliconf methods, options, result
+    cache); commands are answered from text outputs and recorded"""
+
+    DEFAULT_OPTIONS = {"host": "inventory_hostname", "persistent_command_timeout": 30}
+
+    def __init__(self, commands=None, failing=(), host="127.0.0.1"):
+        self.commands = commands or {}
+        self.failing = set(failing)
+        self.options = dict(self.DEFAULT_OPTIONS, host=host, remote_user="sense")
+        self.sent = []
+        self.cache = {}
+        # Started commits: id -> output (None while running)
+        self.commits = {}
+
+    def get_option(self, name):
+        return self.options.get(name)
+
+    def set_option(self, name, value):
+        self.options[name] = value
+
+    def set_options(self, direct=None):
+        # Like AnsiblePlugin.set_options: options not given are reset to defaults
+        self.options = dict(self.DEFAULT_OPTIONS, **(direct or {}))
+
+    def get_device_info(self):
+        return {}
+
+    def get_pending_commit(self):
+        return None
+
+    def invalidate_cache(self):
+        self.cache.clear()
+
+    def get(self, command):
+        self.sent.append(command)
+        if command in self.failing:
+            raise ConnectionError(f"error: syntax error: {command}")
+        return self.commands.get(command, "")
+
+    def get_cached(self, command, ttl, withHit=False):
+        hit = command in self.cache
+        if not hit:
+            self.cache[command] = self.get(command)
+        return {"output": self.cache[command], "hit": hit} if withHit else self.cache[command]
+
+    def start_commit(self, commitId, command):
+        self.sent.append(command)
+        self.commits[commitId] = None
+
+    def poll_commit(self, commitId):
+        output = self.commits.get(commitId)
+        return {"done": output is not None, "output": output or "", "known": commitId in self.commits}
+
+    def exec_command(self, command):
+        """ansible.module_utils.connection.exec_command of the stand-in"""
+        try:
+            command = json.loads(command)["command"]
+        except ValueError:
+            pass
+        try:
+            return 0, self.get(command), ""
+        except ConnectionError as exc:
+            return 1, "", str(exc)
+
+
+def connect(server, params=None):
+    """FakeModule connected to stand-in server"""
+    module = FakeModule(params)
+    module._junos_connection = server
+    module._junos_capabilities = {
+        "network_api": "cliconf" if isinstance(server, StandInCli) else "netconf"
+    }
+    return module
+
+
+@pytest.fixture
+def netconf(state_dir):
+    """Module connected to stand-in server"""
+    server = StandInNetconf(
+        commands={
+            "show interfaces terse": load_fixture("show_interfaces_terse__display_json"),
+            "show version": load_fixture("show_version__display_json"),
+            "show system uptime": "Current time: 2024-07-15 10:00:00 UTC",
+        },
+        config="system {\n    host-name atlas-rt-1-2;\n}",
+    )
+    return connect(server), server
+
+
+@pytest.fixture
+def cli(state_dir, monkeypatch):
+    """Stand-in cli connection (exec_command is routed to it)"""
+    server = StandInCli()
+    monkeypatch.setattr(
+        junos, "exec_command", lambda _module, command: server.exec_command(command)
+    )
+    return server
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Device admission of config reads and async commits (stand-in cli)."""
+import pytest
+from conftest import FailJson, connect
+
+from ansible_collections.sense.junos.plugins.module_utils.network import junos
+
+ADMISSION_PARAMS = {"max_heavy_commands": 1, "admission_timeout": 1}
+
+
+def test_async_commit_keeps_commit_slot(cli):
+    module = connect(cli, dict(ADMISSION_PARAMS, admission_timeout=60))
+    handle = junos.load_config(module, ["set system host-name atlas-rt-1-2"], commit_async=True)
+    assert handle["admission"]
+    # Device is still committing: other commits wait for it
+    with pytest.raises(FailJson) as exc:
+        junos.load_config(connect(cli, ADMISSION_PARAMS), ["set system location rack 2"])
+    assert "admission" in exc.value.args[0]["msg"]
+    assert not junos.commit_status(module, handle)["done"]
+    assert junos.get_admission(module).getHeldCommit()["id"] == handle["id"]
+    cli.commits[handle["id"]] = "commit complete"
+    assert junos.commit_status(module, handle)["done"]
+    assert junos.get_admission(module).getHeldCommit() is None
+    junos.load_config(connect(cli, ADMISSION_PARAMS), ["set system location rack 2"])
+
+
+def test_held_commit_expires(cli):
+    admission = junos.get_admission(connect(cli, ADMISSION_PARAMS))
+    admission.holdCommit("sense-abandoned", -1)
+    assert admission.getHeldCommit() is None
+    junos.load_config(connect(cli, ADMISSION_PARAMS), ["set system location rack 2"])
+
+
+@pytest.mark.parametrize(
+    "read",
+    [
+        lambda module: junos.get_config(module),
+        lambda module: junos.get_device_diff(module, ["set system location rack 2"]),
+    ],
+    ids=["get_config", "get_device_diff"],
+)
+def test_config_reads_admitted(cli, read):
+    module = connect(cli, ADMISSION_PARAMS)
+    busy = junos.get_admission(module)
+    busy.acquire("heavy")
+    try:
+        with pytest.raises(FailJson) as exc:
+            read(module)
+        assert "admission" in exc.value.args[0]["msg"]
+        assert not cli.sent
+    finally:
+        busy.release()
+    read(module)
+    assert junos.get_admission_waits(module)[-1]["kind"] == "heavy"
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""Deduplicated config backup store chunking."""
+from ansible_collections.sense.junos.plugins.module_utils.backupstore import (
+    CHUNK_MAX_LINES, BackupStore, chunkConfig)
+
+
+def make_config(prefixes=3000, extra=()):
+    """Config with a large flat prefix-list and a few small blocks"""
+    lines = ["version 23.4R1;", "system {", "    host-name atlas-rt-1-2;", "}"]
+    lines += ["policy-options {", "    prefix-list sense-allowed {"]
+    for idx in range(prefixes):
+        lines.append(f"        10.{idx // 65536}.{idx // 256 % 256}.{idx % 256}/32;")
+        if idx in extra:
+            lines.append(f"        192.168.{idx // 256 % 256}.{idx % 256}/32;")
+    lines += ["    }", "}"]
+    for idx in range(8):
+        lines += ["interfaces {", f"    et-0/0/{idx} {{", "        mtu 9216;", "    }", "}"]
+    return "\n".join(lines)
+
+
+def test_flat_block_grouped():
+    config = make_config()
+    chunks = chunkConfig(config)
+    assert "\n".join(chunks) == config
+    # 3000 sibling lines are grouped, not stored as single line objects
+    assert len(chunks) < 3000 // 4
+    assert all(chunk.count("\n") < CHUNK_MAX_LINES for chunk in chunks)
+
+
+def test_insert_changes_few_chunks():
+    old = set(chunkConfig(make_config()))
+    new = chunkConfig(make_config(extra={1500}))
+    assert len([chunk for chunk in new if chunk not in old]) <= 2
+
+
+def test_store_rebuild_and_diff(tmp_path):
+    store = BackupStore("atlas-rt-1-2", rootdir=str(tmp_path))
+    first = store.add(make_config())
+    second = store.add(make_config(extra={1500}))
+    assert second["new_chunks"] <= 2
+    assert store.rebuild(first["id"]) == make_config()
+    assert store.rebuild(second["id"]) == make_config(extra={1500})
+    diff = store.diff(first["id"], second["id"])
+    assert [line for line in diff if line.startswith("+") and not line.startswith("+++")] == [
+        "+        192.168.5.220/32;"
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+"""module_utils over a stand-in network_cli connection."""
+import pytest
+from conftest import FailJson, connect
+
+from ansible_collections.sense.junos.plugins.module_utils.network import junos
+
+
+def test_set_command_timeout_keeps_options(cli):
+    module = connect(cli)
+    junos.set_command_timeout(module, 90)
+    assert cli.options["persistent_command_timeout"] == 90
+    assert cli.options["host"] == "127.0.0.1" and cli.options["remote_user"] == "sense"
+    junos.set_command_timeout(module, None)
+    assert cli.options["persistent_command_timeout"] == 30
+    assert junos.get_device_host(module) == "127.0.0.1"
+
+
+def test_latency_recorded_on_cache_miss(cli):
+    module = connect(cli)
+    for _run in range(3):
+        junos.run_commands(module, ["show system uptime"], cache_ttl=60)
+    assert cli.sent == ["show system uptime"]
+    assert len(junos.get_latency_store(module).get("show system uptime")) == 1
+
+
+@pytest.mark.parametrize("failing", ["set system location bad", "show | compare"])
+def test_device_diff_closes_private_config(cli, failing):
+    cli.failing.add(failing)
+    with pytest.raises(FailJson):
+        junos.get_device_diff(connect(cli), ["set system location bad"])
+    assert cli.sent[0] == "configure private"
+    assert cli.sent[-2:] == ["rollback 0", "exit configuration-mode"]
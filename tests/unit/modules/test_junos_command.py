@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""junos_command wait_for conditionals translated to device side filters."""
+import pytest
+from ansible_collections.ansible.netcommon.plugins.module_utils.network.common.parsing import \
+    Conditional
+
+from ansible_collections.sense.junos.plugins.modules import junos_command
+
+COMMANDS = [{"command": "show system alarms", "prompt": None}]
+
+
+@pytest.mark.parametrize(
+    "conditional,probe",
+    [
+        ("result[0] contains Major", 'show system alarms | match "Major"'),
+        ("result[0] contains 'Major|Minor'", None),
+        ("result[0] matches Major.*PEM", 'show system alarms | match "Major.*PEM"'),
+        ("result[0] matches ^Major", None),
+        ("result[0] matches active$", None),
+        ("result[0] matches (?i)major", None),
+        ("result[0] == No alarms", None),
+    ],
+)
+def test_to_probe(conditional, probe):
+    assert junos_command.to_probe(COMMANDS, Conditional(conditional)) == probe
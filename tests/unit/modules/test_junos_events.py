@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""Syslog events and event driven junos_facts cache (stand-in netconf server)."""
+import copy
+import os
+import socket
+import socketserver
+import threading
+import time
+from fnmatch import fnmatch
+
+import pytest
+from conftest import FIXTURE_PATH, StandInNetconf, connect, load_fixture
+
+from ansible_collections.sense.junos.plugins.module_utils.events import (
+    EVENT_SUBSETS, EventState, SyslogHandler, parseSyslog)
+from ansible_collections.sense.junos.plugins.modules import junos_facts
+
+HOST = "127.0.0.1"
+FACTS_PARAMS = {
+    "cache_ttl": 0,
+    "event_max_age": 3600,
+    "gather_scope": None,
+    "mac_index": False,
+    "wire_format": "json",
+}
+
+
+def read_syslog():
+    """Syslog lines fixture"""
+    with open(os.path.join(FIXTURE_PATH, "syslog_events"), encoding="utf-8") as fd:
+        return fd.read().splitlines()
+
+
+def only_interfaces(data, pattern):
+    """show interfaces output with only interfaces matching pattern"""
+    data = copy.deepcopy(data)
+    info = data["interface-information"][0]
+    info["physical-interface"] = [
+        intf
+        for intf in info["physical-interface"]
+        if fnmatch(intf["name"][0]["data"], pattern)
+    ]
+    return data
+
+
+@pytest.fixture
+def device(state_dir):
+    """Stand-in device answering interfaces subset commands"""
+    interfaces = load_fixture("show_interfaces_brief__display_json")
+    commands = {
+        "show vlans detail": load_fixture("show_vlans__display_json"),
+        "show lldp neighbors": load_fixture("show_lldp_neighbors__display_json"),
+        "show interfaces": interfaces,
+    }
+    for pattern in ("ae*", "et-0/0/0", "et-0/0/16", "et-0/0/34"):
+        commands[f"show interfaces {pattern}"] = only_interfaces(interfaces, pattern)
+    return StandInNetconf(
+        commands, deviceInfo={"network_os_model": "qfx5120-32c", "network_os_version": "23.4R1"}
+    )
+
+
+def collect(server, **params):
+    """Collect interfaces subset with event state. Returns (facts, how)"""
+    module = connect(server, dict(FACTS_PARAMS, **params))
+    server.rpcs = []
+    _inst, facts, _index, how = junos_facts.collect_subset(
+        module, "interfaces", EventState(HOST)
+    )
+    return copy.deepcopy(facts), how
+
+
+def vlan_members(facts, vlan):
+    """All member interfaces of vlan"""
+    entry = facts["interfaces"][f"Vlan{vlan}"]
+    return {intf for key, intfs in entry.items() if key != "mtu" for intf in intfs}
+
+
+@pytest.mark.parametrize(
+    "idx,expected",
+    [
+        (0, ("atlas-rt-1-2", "SNMP_TRAP_LINK_DOWN", "et-0/0/34")),
+        (1, ("atlas-rt-1-2", "LLDP_NEIGHBOR_DOWN", "et-0/0/16")),
+        (2, ("atlas-rt-1-2", "UI_COMMIT_COMPLETED", "")),
+        (3, None),
+        (4, None),
+    ],
+)
+def test_parse_syslog(idx, expected):
+    assert parseSyslog(read_syslog()[idx]) == expected
+
+
+def test_syslog_replay_over_udp(state_dir):
+    lines = read_syslog()
+    with socketserver.UDPServer((HOST, 0), SyslogHandler) as server:
+        server.useHostname = False
+        server.verbose = False
+        server.timeout = 5
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for line in lines:
+                sock.sendto(line.encode("utf-8"), server.server_address)
+            # Hostname keyed (--use-hostname), one datagram with two lines
+            sock.sendto("\n".join(lines[:2]).encode("utf-8"), server.server_address)
+        for _line in lines:
+            server.handle_request()
+        server.useHostname = True
+        server.handle_request()
+    state = EventState(HOST)
+    assert state.getDirty("interfaces") == {"interfaces": ["et-0/0/34", "et-0/0/16"], "all": True}
+    assert state.getDirty("interfaces_status") == {"all": True}
+    # Not event cached subsets are never marked dirty
+    assert state.getDirty("routing") == {}
+    assert state.getDirty("default") == {}
+    assert EventState("atlas-rt-1-2").getDirty("interfaces") == {
+        "interfaces": ["et-0/0/34", "et-0/0/16"]
+    }
+
+
+@pytest.mark.parametrize("subset", ["default", "routing"])
+def test_subset_not_event_cached(subset):
+    assert subset not in junos_facts.EVENT_SUBSETS
+    assert all(subset not in subsets for subsets, _intf in EVENT_SUBSETS.values())
+
+
+def test_events_read_modify_write_locked(state_dir):
+    state = EventState(HOST)
+    state.mark("SNMP_TRAP_LINK_DOWN", "et-0/0/34")
+    started = time.time()
+    # Listener mark waits while another process holds the lock
+    with state.dirty.locked():
+        listener = threading.Thread(
+            target=EventState(HOST).mark, args=("LLDP_NEIGHBOR_DOWN", "et-0/0/16")
+        )
+        listener.start()
+        listener.join(0.2)
+        assert listener.is_alive()
+    listener.join(5)
+    # setFacts waits too
+    state.setFacts("interfaces_status", {"facts": {}, "macindex": {}}, started)
+    facts = threading.Thread(
+        target=state.setFacts, args=("interfaces", {"facts": {}, "macindex": {}}, started)
+    )
+    with state.dirty.locked():
+        facts.start()
+        facts.join(0.2)
+        assert facts.is_alive()
+    facts.join(5)
+    # Event marked after collection started is kept
+    assert state.getDirty("interfaces") == {"interfaces": ["et-0/0/34", "et-0/0/16"]}
+    assert state.getDirty("interfaces_status") == {}
+
+
+def test_partial_recollect_keeps_vlan_members(device):
+    full, how = collect(device)
+    assert how == "collected"
+    assert vlan_members(full, 3038) == {"ae1", "et-0/0/34"}
+    assert set(full["port_vlans"]) == {"ae1", "et-0/0/34"}
+    EventState(HOST).mark("SNMP_TRAP_LINK_DOWN", "et-0/0/34")
+    partial, how = collect(device)
+    assert how == "partial"
+    assert "<command format=\"xml\">show interfaces et-0/0/34</command>" in device.rpcs[-1]
+    assert partial == full
+    assert collect(device) == (full, "cached")
+
+
+def test_partial_recollect_member_change(device):
+    full, _how = collect(device)
+    vlans = device.commands["show vlans detail"]
+    for vlan in vlans["l2ng-l2ald-vlan-instance-information"][0]["l2ng-l2ald-vlan-instance-group"]:
+        if vlan["l2ng-l2rtb-vlan-tag"][0]["data"] == "58":
+            vlan["l2ng-l2rtb-vlan-member"] = [
+                {"l2ng-l2rtb-vlan-member-interface": [{"data": [None]}]}
+            ]
+    EventState(HOST).mark("SNMP_TRAP_LINK_UP", "et-0/0/34")
+    partial, how = collect(device)
+    assert how == "partial"
+    assert vlan_members(full, 58) == {"et-0/0/34"}
+    assert vlan_members(partial, 58) == set()
+    assert vlan_members(partial, 3038) == {"ae1", "et-0/0/34"}
+    assert partial["port_vlans"]["ae1"] == full["port_vlans"]["ae1"]
+    assert list(partial["port_vlans"]["et-0/0/34"].values()) == ["3038"]
+
+
+def test_cache_keyed_by_scope(device):
+    full, _how = collect(device)
+    scope = {"interfaces": ["et-0/0/34"], "vlans": None}
+    scoped, how = collect(device, gather_scope=scope)
+    assert how == "collected"
+    assert "et-0/0/0" in full["interfaces"] and "et-0/0/0" not in scoped["interfaces"]
+    assert collect(device, gather_scope=scope) == (scoped, "cached")
+    assert collect(device, wire_format="xml")[1] == "collected"
+    assert collect(device) == (full, "cached")
+
+
+def test_dirty_interface_out_of_scope(device):
+    scope = {"interfaces": ["et-0/0/34"], "vlans": None}
+    scoped, _how = collect(device, gather_scope=scope)
+    collect(device)
+    EventState(HOST).mark("SNMP_TRAP_LINK_DOWN", "et-0/0/0")
+    assert collect(device, gather_scope=scope) == (scoped, "cached")
+    assert EventState(HOST).getDirty("interfaces") == {}
+    # Unscoped facts predate the event, dropped when dirty state is cleared
+    assert collect(device)[1] == "collected"
+
+
+def test_commit_recollects_all(device):
+    collect(device)
+    EventState(HOST).mark("UI_COMMIT_COMPLETED")
+    _facts, how = collect(device)
+    assert how == "collected"
+    assert "<command format=\"xml\">show interfaces</command>" in "".join(device.rpcs)
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""junos_facts fact profiles: facts size and controller memory per host."""
+import json
+import tracemalloc
+
+import pytest
+from conftest import FailJson, StandInNetconf, connect, load_fixture
+
+from ansible_collections.sense.junos.plugins.modules import junos_facts
+
+SUBSETS = {"default", "interfaces", "routing"}
+FACTS_PARAMS = {
+    "cache_ttl": 0,
+    "event_driven": False,
+    "gather_scope": None,
+    "wire_format": "json",
+}
+
+
+def mac_table(count):
+    """l2ng mac table output with count entries on vlan member ports"""
+    entries = []
+    for idx in range(count):
+        intf = "ae1.0" if idx % 2 else "et-0/0/34.0"
+        entries.append(
+            {
+                "l2ng-l2-mac-address": [{"data": f"00:1b:21:3a:{idx // 256:02x}:{idx % 256:02x}"}],
+                "l2ng-l2-vlan-id": [{"data": "3038" if idx % 3 else "58"}],
+                "l2ng-l2-mac-logical-interface": [{"data": intf}],
+            }
+        )
+    return {"l2ng-l2ald-rtb-macdb": [{"l2ng-l2ald-mac-entry-vlan": entries}]}
+
+
+@pytest.fixture
+def device(state_dir):
+    """Stand-in device answering default, interfaces and routing commands"""
+    interfaces = load_fixture("show_interfaces_brief__display_json")
+    info = interfaces["interface-information"][0]
+    lags = dict(
+        interfaces,
+        **{
+            "interface-information": [
+                dict(
+                    info,
+                    **{
+                        "physical-interface": [
+                            intf
+                            for intf in info["physical-interface"]
+                            if intf["name"][0]["data"].startswith("ae")
+                        ]
+                    },
+                )
+            ]
+        },
+    )
+    return StandInNetconf(
+        {
+            "show version": load_fixture("show_version__display_json"),
+            "show ethernet-switching table detail": mac_table(500),
+            "show vlans detail": load_fixture("show_vlans__display_json"),
+            "show lldp neighbors": load_fixture("show_lldp_neighbors__display_json"),
+            "show interfaces": interfaces,
+            "show interfaces ae*": lags,
+            "show route all": load_fixture("show_route_all__display_json"),
+        },
+        deviceInfo={"network_os_model": "qfx5120-32c", "network_os_version": "23.4R1"},
+    )
+
+
+def gather(server, profile, macIndex=False):
+    """Gather facts as returned to the controller"""
+    module = connect(server, dict(FACTS_PARAMS, fact_profile=profile, mac_index=macIndex))
+    facts = junos_facts.gather_facts(module, set(SUBSETS))
+    return {f"ansible_net_{key}": value for key, value in facts.items()}
+
+
+def measure(facts):
+    """Facts size (json bytes) and controller memory of facts loaded from
+    module result (bytes allocated by json.loads)"""
+    data = json.dumps({"ansible_facts": facts}, default=sorted)
+    tracemalloc.start()
+    loaded = json.loads(data)
+    memory, _peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del loaded
+    return len(data.encode("utf-8")), memory
+
+
+@pytest.mark.parametrize("macIndex", [False, True])
+def test_compact_facts_size_and_memory(device, macIndex):
+    full = measure(gather(device, "full", macIndex))
+    compact = measure(gather(device, "compact", macIndex))
+    assert compact[0] < full[0]
+    assert compact[1] < full[1]
+    if macIndex:
+        # Duplicate mac table (mactable and info.macs) is dropped
+        assert compact[0] < full[0] * 0.8
+        assert compact[1] < full[1] * 0.9
+
+
+def test_compact_drops_duplicates(device):
+    full = gather(device, "full", macIndex=True)
+    compact = gather(device, "compact", macIndex=True)
+    assert compact["ansible_net_schema_version"] == junos_facts.COMPACT_SCHEMA_VERSION
+    assert full["ansible_net_mactable"] and full["ansible_net_info"]["macs"]
+    assert "ansible_net_mactable" not in compact
+    assert "ansible_net_info" not in compact
+    assert compact["ansible_net_macindex"] == full["ansible_net_macindex"]
+    # Without macindex, mactable is the only mac table and is kept
+    compact = gather(device, "compact")
+    assert compact["ansible_net_mactable"] == full["ansible_net_mactable"]
+    assert "ansible_net_macindex" not in compact
+
+
+def test_compact_typed_fields(device):
+    compact = gather(device, "compact")
+    assert compact["ansible_net_default"]["hostname"] == "atlas-rt-1-2"
+    assert compact["ansible_net_interfaces"]["et-0/0/34"]["mtu"] == 1518
+    assert compact["ansible_net_gather_subset"] == sorted(SUBSETS)
+
+
+def test_vlans_without_numeric_tag_skipped(device):
+    vlans = device.commands["show vlans detail"]
+    groups = vlans["l2ng-l2ald-vlan-instance-information"][0]["l2ng-l2ald-vlan-instance-group"]
+    groups.append(
+        {
+            "l2ng-l2rtb-vlan-name": [{"data": "__internal_vlan__"}],
+            "l2ng-l2rtb-vlan-tag": [{"data": "NA"}],
+            "l2ng-l2rtb-vlan-member": [
+                {"l2ng-l2rtb-vlan-member-interface": [{"data": "et-0/0/34.0*"}]}
+            ],
+        }
+    )
+    facts = gather(device, "full")
+    assert "VlanNA" not in facts["ansible_net_interfaces"]
+    assert "Vlan3038" in facts["ansible_net_interfaces"]
+
+
+@pytest.mark.parametrize("vlans", ["100-", "abc", "100,2x"])
+def test_bad_vlan_scope_fails(device, vlans):
+    module = connect(device, dict(FACTS_PARAMS, gather_scope={"interfaces": None, "vlans": vlans}))
+    with pytest.raises(FailJson) as exc:
+        junos_facts.Interfaces(module).populate()
+    assert f"Bad gather_scope.vlans range '{vlans}'" in exc.value.args[0]["msg"]
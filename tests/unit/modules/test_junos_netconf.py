@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Netconf transport against a local stand-in server (canned rpc-replies)."""
+import json
+import xml.etree.ElementTree as ET
+
+import pytest
+from conftest import FailJson, load_fixture, rpc_reply, to_xml, without_xmlns
+
+from ansible_collections.sense.junos.plugins.module_utils.network import junos
+
+
+@pytest.mark.parametrize(
+    "fixture", ["show_interfaces_terse__display_json", "show_lldp_neighbors__display_json"]
+)
+def test_xml_to_json_matches_display_json(monkeypatch, fixture):
+    # Small chunks, so elements are split across parser feeds
+    monkeypatch.setattr(junos, "XML_CHUNK_SIZE", 97)
+    data = load_fixture(fixture)
+    reply = rpc_reply(*[to_xml(key, node[0]) for key, node in data.items()])
+    assert junos.xml_to_json(reply) == without_xmlns(data)
+
+
+def test_xml_to_json_not_xml():
+    assert junos.xml_to_json("error: syntax error") == "error: syntax error"
+    assert junos.xml_to_json("<broken") == "<broken"
+
+
+@pytest.mark.parametrize(
+    "command,raw,fmt,convert",
+    [
+        ("show version", False, "text", False),
+        ("show version | display xml", False, "xml", False),
+        ("show version | display json", False, "xml", True),
+        ("show version | display json", True, "json", False),
+        ("show version | display xml", True, "xml", False),
+    ],
+)
+def test_command_rpc(command, raw, fmt, convert):
+    rpc, rpcFmt, rpcConvert = junos.command_rpc(command, raw)
+    elem = ET.fromstring(rpc)
+    assert (elem.tag, elem.text, elem.get("format")) == ("command", "show version", fmt)
+    assert (rpcFmt, rpcConvert) == (fmt, convert)
+
+
+def test_command_rpc_escapes():
+    rpc, _fmt, _convert = junos.command_rpc('show interfaces descriptions | match "<a&b>"')
+    assert ET.fromstring(rpc).text == 'show interfaces descriptions | match "<a&b>"'
+
+
+def test_exec_netconf_command(netconf):
+    module, _server = netconf
+    expected = without_xmlns(load_fixture("show_interfaces_terse__display_json"))
+    ret, out, _err = junos.exec_netconf_command(module, "show interfaces terse | display json")
+    assert ret == 0 and out == expected
+    ret, out, _err = junos.exec_netconf_command(module, "show system uptime")
+    assert ret == 0 and out == "Current time: 2024-07-15 10:00:00 UTC"
+
+
+def test_exec_netconf_command_raw(netconf):
+    module, _server = netconf
+    _ret, out, _err = junos.exec_netconf_command(module, "show version | display json", raw=True)
+    assert json.loads(out) == load_fixture("show_version__display_json")
+    _ret, out, _err = junos.exec_netconf_command(module, "show version | display xml", raw=True)
+    assert out.startswith("<") and "atlas-rt-1-2" in out
+    assert junos.xml_to_json(out) == load_fixture("show_version__display_json")
+
+
+def test_run_commands_netconf(netconf):
+    module, _server = netconf
+    out = junos.run_commands(module, ["show version | display json", "show system uptime"])
+    assert out == [
+        load_fixture("show_version__display_json"),
+        "Current time: 2024-07-15 10:00:00 UTC",
+    ]
+
+
+def test_get_config_netconf(netconf):
+    module, server = netconf
+    junos._DEVICE_CONFIGS.clear()
+    assert junos.get_config(module) == server.config
+    assert ET.fromstring(server.rpcs[-1]).tag == "get-configuration"
+    junos._DEVICE_CONFIGS.clear()
+
+
+def test_netconf_load_config(netconf):
+    module, server = netconf
+    junos.netconf_load_config(
+        module, ["set system host-name r1", "commit and-quit"], confirm=5, comment="change-1"
+    )
+    tags = [ET.fromstring(rpc).tag for rpc in server.rpcs]
+    assert tags == [
+        "open-configuration",
+        "load-configuration",
+        "commit-configuration",
+        "close-configuration",
+    ]
+    assert server.candidate == "set system host-name r1"
+    commit = ET.fromstring(server.rpcs[2])
+    assert commit.find("confirm-timeout").text == "5"
+    assert commit.find("confirmed") is not None
+    assert commit.find("log").text == "change-1"
+
+
+def test_netconf_load_config_check_mode(netconf):
+    module, server = netconf
+    module.check_mode = True
+    junos.netconf_load_config(module, ["set system host-name r1"])
+    tags = [ET.fromstring(rpc).tag for rpc in server.rpcs]
+    assert tags == ["open-configuration", "load-configuration", "close-configuration"]
+
+
+def test_netconf_load_config_rpc_error(netconf):
+    module, server = netconf
+    with pytest.raises(FailJson):
+        junos.netconf_load_config(module, ["set system invalid"])
+    assert ET.fromstring(server.rpcs[-1]).tag == "close-configuration"
+    assert "commit-configuration" not in "".join(server.rpcs)
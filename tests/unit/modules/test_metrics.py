@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Module run metrics (Prometheus textfile)."""
+import pytest
+from conftest import FailJson, StandInNetconf, connect
+
+from ansible_collections.sense.junos.plugins.module_utils.metrics import Metrics
+from ansible_collections.sense.junos.plugins.module_utils.network import junos
+
+
+# Non-ascii output: bytes read differ from characters
+ALARMS = "2 alarms currently active: ñ — µ"
+
+
+def read_prom(metricsdir):
+    """Samples of written metrics file: {name{labels}: value}"""
+    path = metricsdir / "sense_junos_junos_command_127.0.0.1.prom"
+    samples, types = {}, {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if line.startswith("# TYPE "):
+            name, mtype = line[7:].split(" ")
+            types[name] = mtype
+        elif line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = value
+            # Prometheus 0.0.4: counter samples are named as in TYPE
+            family = name.split("{")[0]
+            if family not in types:
+                family = family.rsplit("_", 1)[0]
+            assert family in types, name
+    return samples
+
+
+@pytest.fixture
+def metrics_module(state_dir, tmp_path):
+    """Module with metrics enabled, connected to stand-in server"""
+    server = StandInNetconf({"show system alarms": ALARMS})
+    module = connect(server, {"metrics_dir": str(tmp_path / "metrics")})
+    junos.start_metrics(module, "junos_command")
+    yield module
+    junos.write_metrics(module)
+
+
+def test_metrics_written_on_success(metrics_module, tmp_path):
+    junos.run_commands(metrics_module, ["show system alarms"])
+    junos.write_metrics(metrics_module)
+    samples = read_prom(tmp_path / "metrics")
+    key = 'sense_junos_command_bytes_total{host="127.0.0.1",module="junos_command",'
+    assert samples[key + 'command="show system alarms"}'] == str(len(ALARMS.encode("utf-8")))
+    assert len(ALARMS.encode("utf-8")) > len(ALARMS)
+    assert samples['sense_junos_runs_total{host="127.0.0.1",module="junos_command"}'] == "1"
+    assert 'sense_junos_failed_runs_total{host="127.0.0.1",module="junos_command"}' not in samples
+
+
+def test_metrics_written_on_fail_json(metrics_module, tmp_path):
+    junos.run_commands(metrics_module, ["show system alarms"])
+    with pytest.raises(FailJson):
+        metrics_module.fail_json(msg="command timeout triggered")
+    assert junos.get_metrics(metrics_module) is None
+    samples = read_prom(tmp_path / "metrics")
+    labels = '{host="127.0.0.1",module="junos_command"}'
+    assert samples["sense_junos_runs_total" + labels] == "1"
+    assert samples["sense_junos_failed_runs_total" + labels] == "1"
+    assert any(key.startswith("sense_junos_command_duration_seconds_count") for key in samples)
+
+
+def test_metrics_written_on_command_error(metrics_module, tmp_path):
+    # Stand-in has no reply for the command: connection error -> fail_json
+    with pytest.raises(FailJson):
+        junos.run_commands(metrics_module, ["show chassis hardware"])
+    samples = read_prom(tmp_path / "metrics")
+    assert samples['sense_junos_failed_runs_total{host="127.0.0.1",module="junos_command"}'] == "1"
+
+
+def test_parse_time_of_output_parsers(state_dir, tmp_path):
+    metrics = Metrics("127.0.0.1", "junos_facts", str(tmp_path))
+
+    def parse_commands():
+        """Argument parsing of junos_command, not an output parser"""
+
+    def parse_interfaces():
+        """Output parser"""
+
+    parse_interfaces.__qualname__ = "Interfaces.parse_interfaces"
+    for func in (parse_commands, parse_interfaces):
+        metrics.hook(func, (), {}, None, 0.01)
+    assert list(metrics.data["parse_duration_seconds"]) == ["Interfaces.parse_interfaces"]